@@ -0,0 +1,595 @@
+"""Benchmark for Grid.find_path
+
+Builds square grids with randomly scattered islands and reports how
+many nodes A-star expands per second when crossing them corner to
+corner.
+
+    python benchmark.py            # 1000x1000 and 4000x4000
+    python benchmark.py 250 500    # any other sizes
+
+A weighted map, with shallow water and currents costing more than
+open sea, is searched next to the plain one to compare throughput.
+If NumPy is installed, the wavefront engine is timed on the same maps,
+and a fleet of boats is stepped across them.
+Grid.find_path_async is timed under many concurrent requests, as a
+service in front of it would see them, and the spatial index answers
+range queries around many objects scattered over each map. Each map
+is also written as a tiled map and searched with a small budget of
+tiles in memory.
+
+The suite times parsing a map file, find_path, retrace_path and
+plot_path separately on seeded maps of each style in STYLES, and
+writes the wall time, peak memory and nodes expanded of each as JSON,
+to compare one commit with another.
+
+    python benchmark.py --suite                          # 100 and 1000
+    python benchmark.py --suite 100 1000 10000 --out run.json
+    python benchmark.py --suite 500 --styles maze corridor --seed 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from grid import Grid
+
+
+def make_map(size, density=0.25, seed=0):
+    """
+    Return a square text grid of the given size, with islands placed
+    at random, the boat in the top left and the treasure in the
+    bottom right corner
+
+    @type size: int
+    @type density: float
+    @type seed: int
+    @rtype: list[str]
+
+    >>> make_map(3, 0.0)
+    ['B..', '...', '..T']
+    """
+    rng = random.Random(seed)
+    rows = []
+    for y in range(size):
+        rows.append("".join("+" if rng.random() < density else "."
+                            for x in range(size)))
+    rows[0] = "B" + rows[0][1:]
+    rows[-1] = rows[-1][:-1] + "T"
+    return rows
+
+
+def _noise_row(rng, size, density):
+    """
+    Return a row of size random characters, each "+" with probability
+    density and "." otherwise, as bytes
+
+    @type rng: random.Random
+    @type size: int
+    @type density: float
+    @rtype: bytearray
+    """
+    cut = round(256 * density)
+    table = bytes(ord("+") if c < cut else ord(".") for c in range(256))
+    return bytearray(rng.getrandbits(8 * size).to_bytes(size, "little")
+                     .translate(table))
+
+
+def _place(rows, boat, treasure):
+    """
+    Put the boat and the treasure on rows at the given coordinates,
+    with open sea around them, and return rows as strings
+
+    @type rows: list[bytearray]
+    @type boat: (int, int)
+    @type treasure: (int, int)
+    @rtype: list[str]
+    """
+    size = len(rows[0])
+    for (x, y), mark in [(boat, b"B"), (treasure, b"T")]:
+        for row in rows[max(0, y - 1):y + 2]:
+            row[max(0, x - 1):x + 2] = b"." * (min(size, x + 2) -
+                                               max(0, x - 1))
+        rows[y][x:x + 1] = mark
+    return [row.decode("ascii") for row in rows]
+
+
+def open_sea(size, seed=0):
+    """
+    Return a size by size text grid of open sea with a few rocks, the
+    boat in the top left and the treasure in the bottom right corner
+
+    @type size: int
+    @type seed: int
+    @rtype: list[str]
+    """
+    rng = random.Random(seed)
+    rows = [_noise_row(rng, size, 0.03) for y in range(size)]
+    return _place(rows, (0, 0), (size - 1, size - 1))
+
+
+def archipelago(size, seed=0):
+    """
+    Return a size by size text grid of round islands of many sizes
+    covering about a third of the sea, the boat in the top left and
+    the treasure in the bottom right corner
+
+    @type size: int
+    @type seed: int
+    @rtype: list[str]
+    """
+    rng = random.Random(seed)
+    rows = [bytearray(b"." * size) for y in range(size)]
+    largest = max(2, size // 40)
+    land = 0
+    while land < size * size // 3:
+        cx = rng.randrange(size)
+        cy = rng.randrange(size)
+        radius = rng.randint(1, largest)
+        for dy in range(-radius, radius + 1):
+            if 0 <= cy + dy < size:
+                half = int((radius * radius - dy * dy) ** 0.5)
+                left = max(0, cx - half)
+                right = min(size, cx + half + 1)
+                rows[cy + dy][left:right] = b"+" * (right - left)
+        land += 3 * radius * radius
+    return _place(rows, (0, 0), (size - 1, size - 1))
+
+
+def maze(size, seed=0):
+    """
+    Return a size by size text grid of one-wide passages between walls,
+    with exactly one way from any passage to any other that does not
+    turn back, the boat in the top left and the treasure in the bottom
+    right corner
+
+    @type size: int
+    @type seed: int
+    @rtype: list[str]
+
+    >>> print("\\n".join(maze(5)))
+    B..+.
+    ++.+.
+    .+...
+    .+++.
+    ....T
+    """
+    rng = random.Random(seed)
+    rows = [bytearray(b"+" * size) for y in range(size)]
+    last = (size - 1) // 2 * 2
+    for y in range(0, size, 2):
+        row = rows[y]
+        bits = rng.getrandbits(size)
+        for x in range(0, size, 2):
+            row[x] = ord(".")
+            if x == last and y == last:
+                continue
+            if y == last or (x != last and bits >> x & 1):
+                row[x + 1] = ord(".")
+            else:
+                rows[y + 1][x] = ord(".")
+    rows = [row.decode("ascii") for row in rows]
+    rows[0] = "B" + rows[0][1:]
+    rows[last] = rows[last][:last] + "T" + rows[last][last + 1:]
+    return rows
+
+
+def corridor(size, seed=0):
+    """
+    Return a size by size text grid with a wall across every fourth
+    row, open at alternate ends, so the only way from the boat in the
+    top left to the treasure at the bottom winds back and forth across
+    the whole map, with a few rocks down the middle of the corridors
+
+    @type size: int
+    @type seed: int
+    @rtype: list[str]
+    """
+    rng = random.Random(seed)
+    rows = []
+    for y in range(size):
+        if y % 4 == 3 and y < size - 1:
+            row = bytearray(b"+" * size)
+            if y // 4 % 2 == 0:
+                row[-2:] = b".."
+            else:
+                row[:2] = b".."
+        elif y % 4 == 1:
+            row = _noise_row(rng, size, 0.02)
+        else:
+            row = bytearray(b"." * size)
+        rows.append(row)
+    return _place(rows, (0, 0), (size - 1, size - 1))
+
+
+# the map generators of the suite, by style
+STYLES = {"open": open_sea, "archipelago": archipelago, "maze": maze,
+          "corridor": corridor}
+
+
+def bench(size):
+    """
+    Run one search on a size by size grid and return a summary line
+
+    @type size: int
+    @rtype: str
+    """
+    g = Grid("", make_map(size))
+    start = time.perf_counter()
+    g.find_path(g.boat, g.treasure)
+    elapsed = time.perf_counter() - start
+    return "{}x{}: {} nodes expanded in {:.3f}s, {:.0f} nodes/s".format(
+        size, size, g.expanded, elapsed, g.expanded / elapsed)
+
+
+def bench_jps(size):
+    """
+    Run A-star and Jump Point Search on the same size by size grid
+    and return a summary line comparing the nodes they expand. The path
+    cache is turned off, or the second search would find the path of
+    the first there.
+
+    @type size: int
+    @rtype: str
+    """
+    g = Grid("", make_map(size))
+    g.path_cache_size = 0
+    g.find_path(g.boat, g.treasure)
+    astar = g.expanded
+    start = time.perf_counter()
+    g.find_path(g.boat, g.treasure, "jps")
+    elapsed = time.perf_counter() - start
+    return "{}x{}: jps expanded {} nodes (A-star {}) in {:.3f}s".format(
+        size, size, g.expanded, astar, elapsed)
+
+
+# the legend of the weighted maps of bench_weighted
+TERRAIN = {"+": None, "~": 3, "=": 5}
+
+
+def weigh(rows, share=0.3, seed=0):
+    """
+    Return rows with share of the sea turned into shallow water "~"
+    and currents "=", in bands across the map, for the TERRAIN legend
+
+    @type rows: list[str]
+    @type share: float
+    @type seed: int
+    @rtype: list[str]
+    """
+    rng = random.Random(seed)
+    weighed = []
+    for y, row in enumerate(rows):
+        mark = "~" if y // 8 % 2 == 0 else "="
+        weighed.append("".join(
+            mark if c == "." and rng.random() < share else c for c in row))
+    return weighed
+
+
+def bench_weighted(size):
+    """
+    Run one search on a size by size archipelago, then on the same map
+    with shallow water and currents costing more, and return a summary
+    line comparing the nodes each expands per second. If the boat and
+    treasure lie in different bodies of water, neither search expands
+    anything, so the line says there is no path instead.
+
+    @type size: int
+    @rtype: str
+    """
+    rows = archipelago(size)
+    plain = Grid("", rows)
+    if plain.component(plain.boat) != plain.component(plain.treasure):
+        return "{}x{}: weighted: no path from the boat to the " \
+            "treasure".format(size, size)
+    rates = []
+    for g in [plain, Grid("", weigh(rows), TERRAIN)]:
+        g.neighbour_masks()
+        g.component(g.boat)
+        start = time.perf_counter()
+        g.find_path(g.boat, g.treasure)
+        elapsed = time.perf_counter() - start
+        rates.append((g.expanded, g.expanded / elapsed if elapsed else 0))
+    if not rates[1][1]:
+        return "{}x{}: weighted: no nodes expanded".format(size, size)
+    return "{}x{}: plain {} nodes at {:.0f} nodes/s, weighted {} nodes " \
+        "at {:.0f} nodes/s, {:.2f}x slower per node".format(
+            size, size, rates[0][0], rates[0][1], rates[1][0], rates[1][1],
+            rates[0][1] / rates[1][1])
+
+
+def bench_wavefront(size):
+    """
+    Time the wavefront engine on a size by size grid and return a
+    summary line
+
+    @type size: int
+    @rtype: str
+    """
+    import wavefront
+    g = Grid("", make_map(size))
+    start = time.perf_counter()
+    wavefront.reachable(g)
+    middle = time.perf_counter()
+    wavefront.distance_field(g)
+    end = time.perf_counter()
+    return "{}x{}: wavefront reachable in {:.3f}s, distance field in " \
+        "{:.3f}s".format(size, size, middle - start, end - middle)
+
+
+def bench_async(size, requests=200, pairs=20, seed=0):
+    """
+    Send requests concurrent requests for paths between pairs random
+    pairs of nodes on a size by size grid to Grid.find_path_async, and
+    return a summary line with the median and 99th percentile latency
+
+    @type size: int
+    @type requests: int
+    @type pairs: int
+    @type seed: int
+    @rtype: str
+    """
+    g = Grid("", make_map(size))
+    rng = random.Random(seed)
+    sea = [i for i in range(size * size) if g.nav[i]]
+    nodes = [(g.node(a % size, a // size), g.node(b % size, b // size))
+             for a, b in (rng.sample(sea, 2) for i in range(pairs))]
+
+    async def ask(start_node, target_node):
+        begin = time.perf_counter()
+        await g.find_path_async(start_node, target_node)
+        return time.perf_counter() - begin
+
+    async def load():
+        return await asyncio.gather(*[ask(*rng.choice(nodes))
+                                      for i in range(requests)])
+
+    latencies = sorted(asyncio.run(load()))
+    return "{}x{}: {} requests, {} searches, latency p50 {:.3f}s p99 " \
+        "{:.3f}s".format(size, size, requests,
+                         g.path_cache_stats["misses"],
+                         latencies[len(latencies) // 2],
+                         latencies[int(len(latencies) * 0.99)])
+
+
+def bench_tiled(size, tile=256, budget=64 << 20, seed=0):
+    """
+    Write a size by size map as a tiled map of tiles tile nodes on a
+    side and return a summary line with the time taken to cross it
+    corner to corner keeping budget bytes of tiles and search state in
+    memory, and whether the search gave up for lack of budget
+
+    @type size: int
+    @type tile: int
+    @type budget: int
+    @type seed: int
+    @rtype: str
+    """
+    from tiles import TiledGrid, compile_tiles
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "map.tiles")
+        compile_tiles("", path, make_map(size, seed=seed), tile)
+        g = TiledGrid(path, budget)
+        start = time.perf_counter()
+        found = g.find_path(g.boat, g.treasure)
+        elapsed = time.perf_counter() - start
+        g.close()
+    return "{}x{} tiled: found={} over_budget={} expanded={} in {:.3f}s, " \
+        "{} tiles read, {} kept".format(size, size, found, g.over_budget,
+                                        g.expanded, elapsed, g.loads,
+                                        len(g._tiles))
+
+
+def bench_index(size, objects=20000, queries=2000, radius=300, seed=0):
+    """
+    Scatter objects objects at random over a size by size open sea in a
+    SpatialIndex, and return a summary line with the time taken to find
+    the objects within radius of queries of them, and to find the 8
+    nearest to each
+
+    @type size: int
+    @type objects: int
+    @type queries: int
+    @type radius: int
+    @type seed: int
+    @rtype: str
+    """
+    from spatial import SpatialIndex
+    g = Grid("", open_sea(size, seed))
+    rng = random.Random(seed)
+    index = SpatialIndex(g)
+    for key in range(objects):
+        index.insert(key, rng.randrange(size), rng.randrange(size))
+    nodes = [g.node(*index.position(rng.randrange(objects)))
+             for _ in range(queries)]
+    start = time.perf_counter()
+    found = sum(len(near) for near in index.within_many(nodes, radius))
+    within = time.perf_counter() - start
+    start = time.perf_counter()
+    index.nearest_many(nodes, 8)
+    nearest = time.perf_counter() - start
+    return "{}x{}: {} objects, {} range queries in {:.3f}s ({} found), " \
+        "{} 8-nearest queries in {:.3f}s".format(size, size, len(index),
+                                                 queries, within, found,
+                                                 queries, nearest)
+
+
+def bench_fleet(size, boats=100000, ticks=50, seed=0):
+    """
+    Step a fleet of boats placed at random on a size by size open sea
+    with random directions for ticks ticks, and return a summary line
+    with the boat moves checked per millisecond
+
+    @type size: int
+    @type boats: int
+    @type ticks: int
+    @type seed: int
+    @rtype: str
+    """
+    import numpy as np
+    from fleet import Fleet
+    g = Grid("", open_sea(size, seed))
+    rng = np.random.default_rng(seed)
+    sea = np.flatnonzero(np.frombuffer(g.nav, dtype=np.uint8))
+    cells = rng.choice(sea, min(boats, len(sea)), replace=False)
+    fleet = Fleet(g, np.stack([cells % size, cells // size], axis=1))
+    plan = rng.integers(0, 9, (ticks, len(fleet)), dtype=np.int8)
+    start = time.perf_counter()
+    fleet.run(plan)
+    elapsed = time.perf_counter() - start
+    return "{}x{}: {} boats for {} ticks in {:.3f}s, {:.0f} boat steps/ms, " \
+        "{} held back".format(size, size, len(fleet), ticks, elapsed,
+                              len(fleet) * ticks / elapsed / 1000,
+                              fleet.collisions)
+
+
+def _measure(action, memory):
+    """
+    Call action and return its result, the wall time it took and, if
+    memory is True, the peak memory it allocated in bytes, else None.
+    Tracing memory slows the call down, so time and memory should be
+    taken from separate calls.
+
+    @type action: () -> object
+    @type memory: bool
+    @rtype: (object, float, int | None)
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = action()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _run_phases(path, memory):
+    """
+    Parse the map file at path, find, retrace and plot the path from
+    the boat to the treasure on it, and return what each phase took as
+    a dict of (result, seconds, peak bytes) by phase name. The path
+    cache is turned off, so plot_path searches again rather than
+    reusing the path find_path found.
+
+    @type path: str
+    @type memory: bool
+    @rtype: dict[str, (object, float, int | None)]
+    """
+    phases = {}
+    phases["parse"] = _measure(lambda: Grid(path), memory)
+    g = phases["parse"][0]
+    g.path_cache_size = 0
+    phases["find_path"] = _measure(
+        lambda: g.find_path(g.boat, g.treasure), memory)
+    phases["find_path"] += (g.expanded,)
+    phases["retrace_path"] = _measure(
+        lambda: g.retrace_path(g.boat, g.treasure), memory)
+    phases["plot_path"] = _measure(
+        lambda: g.plot_path(g.boat, g.treasure), memory)
+    return phases
+
+
+def _commit():
+    """
+    Return the commit this benchmark runs on, or None outside git
+
+    @rtype: str | None
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(sizes, styles=None, seed=0, memory=True):
+    """
+    Time each phase on a map of each style in styles, all of STYLES by
+    default, at each size in sizes, and return the results as a dict
+    ready to be written as JSON. Every map is parsed from a file, as
+    Grid is used. Peak memory is taken in a second, traced run of the
+    phases on a fresh Grid, unless memory is False.
+
+    @type sizes: list[int]
+    @type styles: list[str] | None
+    @type seed: int
+    @type memory: bool
+    @rtype: dict
+    """
+    results = []
+    for style in styles or list(STYLES):
+        for size in sizes:
+            rows = STYLES[style](size, seed)
+            handle, path = tempfile.mkstemp(suffix=".txt")
+            try:
+                with os.fdopen(handle, "w") as out:
+                    out.write("\n".join(rows))
+                del rows
+                timed = _run_phases(path, False)
+                traced = _run_phases(path, True) if memory else {}
+            finally:
+                os.remove(path)
+            found = timed["find_path"][0]
+            for phase, taken in timed.items():
+                results.append({
+                    "style": style, "size": size, "seed": seed,
+                    "phase": phase, "seconds": round(taken[1], 6),
+                    "peak_bytes": traced[phase][2] if memory else None,
+                    "expanded": taken[3] if phase == "find_path" else None,
+                    "path_length": len(timed["retrace_path"][0])
+                    if found else None})
+    return {"commit": _commit(), "python": platform.python_version(),
+            "results": results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark Grid.find_path")
+    parser.add_argument("sizes", nargs="*", type=int)
+    parser.add_argument("--suite", action="store_true",
+                        help="time each phase on every style of map, as "
+                             "JSON")
+    parser.add_argument("--styles", nargs="+", choices=list(STYLES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the traced run for peak memory")
+    parser.add_argument("--out", help="write the JSON here, not stdout")
+    args = parser.parse_args()
+    if args.suite:
+        report = run_suite(args.sizes or [100, 1000], args.styles,
+                           args.seed, not args.no_memory)
+        if args.out:
+            with open(args.out, "w") as out:
+                json.dump(report, out, indent=1)
+        else:
+            json.dump(report, sys.stdout, indent=1)
+            print()
+        sys.exit()
+    sizes = args.sizes or [1000, 4000]
+    for n in sizes:
+        print(bench(n))
+        print(bench_jps(n))
+        print(bench_weighted(n))
+        print(bench_async(n))
+        print(bench_index(n))
+        print(bench_tiled(n))
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        for n in sizes:
+            print(bench_wavefront(n))
+            print(bench_fleet(n))
@@ -0,0 +1,246 @@
+"""Incremental replanning
+
+A D* Lite planner attached to a Grid. It searches backwards from the
+target, so when the boat moves the search tree stays valid and only the
+ordering keys shift, and when a node changes between sea and island
+only the costs around it are repaired. Replanning after a step of the
+boat or a small change to the map then touches a small part of the
+nodes a fresh find_path would.
+
+    >>> from grid import Grid
+    >>> g = Grid("", ["B...", ".++.", "...T"])
+    >>> planner = DStarLite(g)
+    >>> [str(n) for n in planner.path()]
+    ['True 0 1', 'True 1 2', 'True 2 2', 'True 3 2']
+    >>> g.move("S")
+    >>> g.set_navigable(1, 2, False)
+    >>> [str(n) for n in planner.path()]
+    ['True 1 0', 'True 2 0', 'True 3 1', 'True 3 2']
+"""
+
+from grid import IndexedHeap, Node, STEPS
+
+INFINITY = float("inf")
+
+
+class DStarLite:
+    """
+    An incremental planner for the path from the boat of a Grid to a
+    target node.
+
+    === Attributes: ===
+    @type grid: Grid
+       the grid planned on; its planner is set to this planner
+    @type start: int
+       the index y * width + x of the boat
+    @type target: int
+       the index of the target node
+    @type expanded: int
+       the number of nodes expanded since the planner was made
+    """
+    def __init__(self, grid, target_node=None):
+        """
+        Attach a new planner to grid, planning from its boat to
+        target_node, which defaults to the treasure of grid
+
+        @type self: DStarLite
+        @type grid: Grid
+        @type target_node: Node | None
+        @rtype: None
+        """
+        if target_node is None:
+            target_node = grid.treasure
+        self.grid = grid
+        self.start = grid.boat.grid_y * grid.width + grid.boat.grid_x
+        self.target = target_node.grid_y * grid.width + target_node.grid_x
+        self.expanded = 0
+        self._last = self.start
+        self._km = 0
+        self._g = {}
+        self._rhs = {self.target: 0}
+        self._open = IndexedHeap()
+        self._open.push(self.target, self._key(self.target))
+        grid.planner = self
+
+    def plans(self, start_node, target_node):
+        """
+        Return True if this planner plans the path from start_node to
+        target_node
+
+        @type self: DStarLite
+        @type start_node: Node
+        @type target_node: Node
+        @rtype: bool
+        """
+        width = self.grid.width
+        return start_node.grid_y * width + start_node.grid_x == self.start \
+            and target_node.grid_y * width + target_node.grid_x == self.target
+
+    def _h(self, index):
+        """
+        Return the straight-line distance from the boat to the node with
+        index index, as by Node.distance
+
+        @type self: DStarLite
+        @type index: int
+        @rtype: int
+        """
+        width = self.grid.width
+        ax = abs(index % width - self.start % width)
+        ay = abs(index // width - self.start // width)
+        return 10 * (ax + ay) - 6 * min(ax, ay)
+
+    def _key(self, index):
+        """
+        Return the priority of the node with index index in the open set
+
+        @type self: DStarLite
+        @type index: int
+        @rtype: (float, float)
+        """
+        best = min(self._g.get(index, INFINITY),
+                   self._rhs.get(index, INFINITY))
+        return best + self._h(index) + self._km, best
+
+    def _neighbours(self, index):
+        """
+        Return the neighbours of the node with index index, and the cost
+        of the step to each, as weighted by the cost plane of the grid,
+        which is infinite if either is an island or the step is not
+        allowed by the neighbour mask of the grid
+
+        @type self: DStarLite
+        @type index: int
+        @rtype: list[(int, float)]
+        """
+        grid = self.grid
+        width = grid.width
+        cx = index % width
+        cy = index // width
+        costs = grid.costs
+        mask = 0 if grid.nav[index] == 0 else grid.neighbour_masks()[index]
+        found = []
+        for k, (dx, dy, step) in enumerate(STEPS):
+            x = cx + dx
+            y = cy + dy
+            if 0 <= x < width and 0 <= y < grid.height:
+                other = y * width + x
+                if mask >> k & 1:
+                    found.append((other, (step >> 1) *
+                                  (costs[index] + costs[other])))
+                else:
+                    found.append((other, INFINITY))
+        return found
+
+    def _update(self, index):
+        """
+        Recompute the one-step lookahead cost of the node with index
+        index, and put it in or take it out of the open set
+
+        @type self: DStarLite
+        @type index: int
+        @rtype: None
+        """
+        if index != self.target:
+            g = self._g
+            self._rhs[index] = min([cost + g.get(other, INFINITY)
+                                    for other, cost in self._neighbours(index)]
+                                   + [INFINITY])
+        if index in self._open:
+            self._open.remove(index)
+        if self._g.get(index, INFINITY) != self._rhs.get(index, INFINITY):
+            self._open.push(index, self._key(index))
+
+    def _plan(self):
+        """
+        Expand nodes until the cost of the boat is settled
+
+        @type self: DStarLite
+        @rtype: None
+        """
+        g = self._g
+        rhs = self._rhs
+        open_set = self._open
+        start = self.start
+        while len(open_set) > 0 and (
+                open_set.peek() < self._key(start) or
+                rhs.get(start, INFINITY) != g.get(start, INFINITY)):
+            old_key = open_set.peek()
+            index = open_set.pop()
+            self.expanded += 1
+            new_key = self._key(index)
+            if old_key < new_key:
+                open_set.push(index, new_key)
+            elif g.get(index, INFINITY) > rhs.get(index, INFINITY):
+                g[index] = rhs[index]
+                for other, cost in self._neighbours(index):
+                    self._update(other)
+            else:
+                g[index] = INFINITY
+                self._update(index)
+                for other, cost in self._neighbours(index):
+                    self._update(other)
+
+    def move_start(self, boat):
+        """
+        Tell the planner the boat has moved to the node boat
+
+        @type self: DStarLite
+        @type boat: Node
+        @rtype: None
+        """
+        self.start = boat.grid_y * self.grid.width + boat.grid_x
+        self._km += self._h(self._last)
+        self._last = self.start
+
+    def update_cell(self, grid_x, grid_y):
+        """
+        Tell the planner the node with coordinates grid_x, grid_y has
+        changed between sea and island, or that the steps its neighbour
+        mask allows have changed, as Grid.set_corner_cutting does
+
+        @type self: DStarLite
+        @type grid_x: int
+        @type grid_y: int
+        @rtype: None
+
+        >>> from grid import Grid
+        >>> g = Grid("", ["B+..", "+.+.", "...T"])
+        >>> planner = DStarLite(g)
+        >>> [str(n) for n in planner.path()]
+        ['True 1 1', 'True 2 2', 'True 3 2']
+        >>> g.set_corner_cutting(False)
+        >>> planner.path()
+        []
+        """
+        index = grid_y * self.grid.width + grid_x
+        self._update(index)
+        for other, cost in self._neighbours(index):
+            self._update(other)
+
+    def path(self):
+        """
+        Return the path from the boat to the target as a list of Nodes,
+        without the boat, like Grid.retrace_path, or an empty list if
+        there is no path. Only the part of the search that the moves and
+        map changes since the last call affected is redone.
+
+        @type self: DStarLite
+        @rtype: list[Node]
+        """
+        self._plan()
+        g = self._g
+        width = self.grid.width
+        if g.get(self.start, INFINITY) == INFINITY:
+            return []
+        path = []
+        parent = Node(True, self.start % width, self.start // width)
+        index = self.start
+        while index != self.target:
+            index = min(self._neighbours(index),
+                        key=lambda step: step[1] + g.get(step[0], INFINITY))[0]
+            node = Node(True, index % width, index // width)
+            node.set_parent(parent)
+            path.append(node)
+            parent = node
+        return path
@@ -0,0 +1,216 @@
+"""Fleet simulation
+
+Moves many boats at once over the sea of one Grid. The boats of a
+Fleet are kept as a NumPy array of the indices y * width + x of their
+nodes, and each tick every boat is given a direction, checked against
+the neighbour masks of the grid and moved in one pass over the whole
+array, with no Node made for any of them.
+
+Directions are given as codes: STAY, or one more than the position of
+the step in grid.STEPS. NAMES maps the directions of Grid.move to
+their codes.
+
+    >>> from grid import Grid
+    >>> g = Grid("", ["B....", ".+...", "....T"])
+    >>> fleet = Fleet(g, [(0, 1), (2, 0), (4, 0)])
+    >>> fleet.step(codes(["N", "E", "W"]))
+    array([ True, False, False])
+    >>> fleet.collided
+    array([1, 2])
+    >>> fleet.positions()
+    [(0, 0), (2, 0), (4, 0)]
+"""
+
+import numpy as np
+
+from grid import STEPS
+
+# the code of staying where one is
+STAY = 0
+
+# the code of each direction of Grid.move
+NAMES = {("N" if dy == -1 else "S" if dy == 1 else "") +
+         ("W" if dx == -1 else "E" if dx == 1 else ""): k + 1
+         for k, (dx, dy, step) in enumerate(STEPS)}
+
+
+def codes(directions):
+    """
+    Return the codes of directions, names as taken by Grid.move, or ""
+    to stay, as an array for Fleet.step
+
+    @type directions: list[str]
+    @rtype: numpy.ndarray
+
+    >>> codes(["N", "", "SE"])
+    array([5, 0, 6], dtype=int8)
+    """
+    return np.array([NAMES.get(name, STAY) for name in directions],
+                    dtype=np.int8)
+
+
+class Fleet:
+    """
+    Boats moving together on the sea of one grid, a node each.
+
+    === Attributes: ===
+    @type grid: Grid
+       the grid the boats sail on
+    @type cells: numpy.ndarray
+       cells[i] is the index y * width + x of the node of boat i, as
+       32-bit integers
+    @type every: numpy.ndarray
+       boat i only moves on ticks that are a multiple of every[i]
+    @type tick: int
+       the number of steps taken so far
+    @type refused: numpy.ndarray
+       the boats whose move in the last step was off the map, onto an
+       island or, without corner cutting, between two islands
+    @type collided: numpy.ndarray
+       the boats held back in the last step because they would have
+       shared a node with another boat, or passed through one
+    @type collisions: int
+       the number of boats held back by collisions in all steps
+
+    === Representation invariants ===
+    - no two boats are on the same node
+    - every boat is on the sea
+    """
+    def __init__(self, grid, positions, every=None):
+        """
+        Put a boat on grid at each of positions, given as x, y
+
+        @type self: Fleet
+        @type grid: Grid
+        @type positions: list[(int, int)]
+        @type every: list[int] | None
+           how many ticks apart each boat moves, 1 for all by default
+        @rtype: None
+        """
+        xy = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        if ((xy < 0) | (xy >= [grid.width, grid.height])).any():
+            raise ValueError("every boat must be on the map")
+        cells = xy[:, 1] * grid.width + xy[:, 0]
+        if not np.frombuffer(grid.nav, dtype=np.uint8)[cells].all():
+            raise ValueError("every boat must be on the sea")
+        if np.unique(cells).size != cells.size:
+            raise ValueError("no two boats can share a node")
+        self.grid = grid
+        self.cells = cells.astype(np.int32)
+        if every is None:
+            self.every = np.ones(len(cells), dtype=np.int32)
+        else:
+            self.every = np.asarray(every, dtype=np.int32)
+        self.tick = 0
+        self.refused = np.zeros(0, dtype=np.intp)
+        self.collided = np.zeros(0, dtype=np.intp)
+        self.collisions = 0
+        width = grid.width
+        self._offsets = np.array([0] + [dy * width + dx
+                                        for dx, dy, step in STEPS],
+                                 dtype=np.intp)
+        self._bits = np.array([0] + list(range(len(STEPS))), dtype=np.uint8)
+        # scratch planes over the nodes for finding collisions, kept
+        # all -1 and False between steps
+        self._owner = np.full(grid.width * grid.height, -1, dtype=np.int32)
+        self._crowded = np.zeros(grid.width * grid.height, dtype=bool)
+        self._boats = np.arange(len(cells), dtype=np.int32)
+
+    def __len__(self):
+        """
+        Return the number of boats in this fleet
+
+        @type self: Fleet
+        @rtype: int
+        """
+        return len(self.cells)
+
+    def positions(self):
+        """
+        Return the coordinates x, y of every boat
+
+        @type self: Fleet
+        @rtype: list[(int, int)]
+        """
+        width = self.grid.width
+        return list(zip((self.cells % width).tolist(),
+                        (self.cells // width).tolist()))
+
+    def step(self, directions):
+        """
+        Move every boat one node in its direction in directions, an
+        array of codes, one per boat, and return which boats moved.
+
+        Boats not due to move on this tick, see every, stay. A move off
+        the map or onto an island is refused. Then, while any node
+        would hold two boats, the boats that moved onto it are held
+        back where they were, and two boats swapping nodes are both
+        held back. The tick goes up by one.
+
+        @type self: Fleet
+        @type directions: numpy.ndarray
+        @rtype: numpy.ndarray
+        """
+        # indexing with native integers saves a conversion per lookup
+        old = self.cells.astype(np.intp)
+        directions = np.asarray(directions).astype(np.intp)
+        if (self.every != 1).any():
+            directions = np.where(self.tick % self.every == 0, directions,
+                                  STAY)
+        masks = np.frombuffer(self.grid.neighbour_masks(), dtype=np.uint8)
+        allowed = (directions == STAY) | \
+            (masks[old] >> self._bits[directions] & 1).astype(bool)
+        wanted = np.where(allowed, old + self._offsets[directions], old)
+        self.refused = np.flatnonzero(~allowed)
+
+        # owner[c] is the last boat written to node c; it is only
+        # trusted where that boat is still bound for c
+        owner = self._owner
+        crowded = self._crowded
+        boats = self._boats
+        owner[wanted] = boats
+        crowded[wanted[owner[wanted] != boats]] = True
+        clash = np.flatnonzero(crowded[wanted] & (wanted != old))
+        crowded[wanted] = False
+        new = wanted.copy()
+        held = np.zeros(len(old), dtype=bool)
+        while clash.size:
+            # held back boats return to their own nodes, and the boat
+            # that moved onto one of those, if any, is held back next
+            held[clash] = True
+            back = old[clash]
+            new[clash] = back
+            other = owner[back]
+            owner[back] = clash
+            clash = other[(other >= 0) & (new[np.maximum(other, 0)] == back)]
+        # two boats passing through each other
+        other = owner[old]
+        found = np.maximum(other, 0)
+        swap = (other >= 0) & (other != boats) & (new[found] == old) & \
+            (old[found] == new) & (new != old)
+        if swap.any():
+            held |= swap
+            new = np.where(swap, old, new)
+        owner[wanted] = -1
+        owner[new] = -1
+
+        self.collided = np.flatnonzero(held)
+        self.collisions += len(self.collided)
+        self.cells = new.astype(np.int32)
+        self.tick += 1
+        return new != old
+
+    def run(self, plan):
+        """
+        Step the fleet once for each row of plan, an array of direction
+        codes with a column per boat, and return how many moves were
+        made
+
+        @type self: Fleet
+        @type plan: numpy.ndarray
+        @rtype: int
+        """
+        moves = 0
+        for directions in plan:
+            moves += int(self.step(directions).sum())
+        return moves
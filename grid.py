@@ -7,12 +7,81 @@ where indicated, according to their docstring.
 Also complete the missing doctests.
 """
 
-import functools
+import asyncio
+import mmap
+import multiprocessing
+import os
+import re
+import struct
 import sys
-from container import PriorityQueue
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# the largest stamp the search state can hold
+MAX_STAMP = 0xFFFFFFFF
+
+# maps a navigability byte back to a map character
+TEXT_TABLE = bytes.maketrans(b"\x00\x01", b"+.")
+# PACK_TABLES[k] maps a navigability byte to bit k of a packed byte,
+# counting from the highest, and UNPACK_TABLES[k] maps a packed byte
+# back to the navigability byte held in that bit
+PACK_TABLES = [bytes([0, 0x80 >> k]) + bytes(254) for k in range(8)]
+UNPACK_TABLES = [bytes(byte >> 7 - k & 1 for byte in range(256))
+                 for k in range(8)]
+
+# the default map legend: "+" is an island, and every other character
+# is sea costing 1, see Grid.__init__
+LEGEND = {"+": None}
+# the largest cost a legend can give
+MAX_COST = 255
+
+# a run of navigable nodes in nav
+RUN_PATTERN = re.compile(b"\x01+")
+
+# cost of a node a distance field has not reached yet
+UNREACHED = 0x7FFFFFFF
+
+# how many distance fields a Grid keeps by default
+FIELD_CACHE_SIZE = 8
+
+# how many paths a Grid keeps by default
+PATH_CACHE_SIZE = 1024
+
+# header of the compiled map format: magic, version, flags, width,
+# height, boat x, boat y, treasure x, treasure y
+COMPILED_HEADER = struct.Struct("<4sHHIIIIII")
+COMPILED_MAGIC = b"GRID"
+COMPILED_VERSION = 1
+# flag set when the packed plane is followed by the cost plane
+COMPILED_WEIGHTED = 1
+
+# what an instrumented grid counts and times, see Grid.instrument
+COUNTERS = ["searches", "expanded", "pushes", "reopened", "evaluated"]
+TIMERS = ["parse", "search", "retrace"]
+
+# how many nodes a search expands between checks whether to stop
+STOP_INTERVAL = 256
+
+# (dx, dy, cost) of each step to a neighbour, in the order
+# neighbourhood lists them
+STEPS = [(dx, dy, 10 if dx == 0 or dy == 0 else 14)
+         for dx in [-1, 0, 1] for dy in [1, 0, -1]
+         if dx != 0 or dy != 0]
+
+# how many rows of neighbour masks are worked out at a time
+MASK_BAND = 1024
 
 
-@functools.total_ordering
 class Node:
     """
     Represents a node in the grid. A node can be navigable 
@@ -61,7 +130,16 @@ class Node:
     @type hcost: float
        hcost of the node, as described in the handout
        initially, we set it to the largest possible float
+
+    Nodes keep their attributes in slots rather than a __dict__.
+    gcost and hcost are properties, and fcost is worked out once each
+    time either is set, directly or through set_gcost and set_hcost.
+    Nodes compare by fcost, and hash and test equal by coordinates,
+    so they can be kept in sets and as keys of dicts.
     """
+    __slots__ = ["navigable", "grid_x", "grid_y", "in_path", "parent",
+                 "_gcost", "_hcost", "_fcost"]
+
     def __init__(self, navigable, grid_x, grid_y):
         """
         Initialize a new node
@@ -87,8 +165,45 @@ class Node:
         self.grid_y = grid_y
         self.in_path = False
         self.parent = None
-        self.gcost = sys.float_info.max
-        self.hcost = sys.float_info.max
+        self._gcost = sys.float_info.max
+        self._hcost = sys.float_info.max
+        self._fcost = self._gcost + self._hcost
+
+    @property
+    def gcost(self):
+        """
+        The gcost of this node
+
+        @type self: Node
+        @rtype: float
+
+        >>> n = Node(True, 1, 2)
+        >>> n.set_hcost(14)
+        >>> n.gcost = 20
+        >>> n.fcost()
+        34
+        """
+        return self._gcost
+
+    @gcost.setter
+    def gcost(self, gcost):
+        self._gcost = gcost
+        self._fcost = gcost + self._hcost
+
+    @property
+    def hcost(self):
+        """
+        The hcost of this node
+
+        @type self: Node
+        @rtype: float
+        """
+        return self._hcost
+
+    @hcost.setter
+    def hcost(self, hcost):
+        self._hcost = hcost
+        self._fcost = self._gcost + hcost
 
     def set_gcost(self, gcost):
         """
@@ -104,7 +219,8 @@ class Node:
         >>> n.gcost
         12.0
         """
-        self.gcost = gcost
+        self._gcost = gcost
+        self._fcost = gcost + self._hcost
 
     def set_hcost(self, hcost):
         """
@@ -120,16 +236,23 @@ class Node:
         >>> n.hcost
         12.0
         """
-        self.hcost = hcost
+        self._hcost = hcost
+        self._fcost = self._gcost + hcost
 
     def fcost(self):
         """
-        Compute the fcost of this node according to the handout
+        Return the fcost of this node according to the handout
 
         @type self: Node
         @rtype: float
+
+        >>> n = Node(True, 1, 2)
+        >>> n.set_gcost(20)
+        >>> n.set_hcost(14)
+        >>> n.fcost()
+        34
         """
-        return self.gcost + self.hcost
+        return self._fcost
 
     def set_parent(self, parent):
         """
@@ -160,25 +283,65 @@ class Node:
         @type self: Node
         @type other: Node
         @rtype: bool
+
+        >>> Node(True, 1, 2) == Node(True, 1, 2)
+        True
+        >>> len({Node(True, 1, 2), Node(True, 1, 2), Node(True, 2, 1)})
+        2
         """
-        if type(self) == type(other) and self.navigable == other.navigable and \
-            self.grid_x == other.grid_x and self.grid_y == self.grid_y:
-            return True
-        else:
-            return False
+        return type(self) is type(other) and self.grid_x == other.grid_x \
+            and self.grid_y == other.grid_y \
+            and self.navigable == other.navigable
+
+    def __hash__(self):
+        """
+        Return a hash of the coordinates of this node, which never
+        change, so that equal nodes hash alike
+
+        @type self: Node
+        @rtype: int
+        """
+        return hash((self.grid_x, self.grid_y))
 
     def __lt__(self, other):
         """
-        Return True if self less than other, and false otherwise.
+        Return True if the fcost of self is less than that of other
 
         @type self: Node
         @type other: Node
         @rtype: bool
         """
-        if self.fcost() < other.fcost():
-            return True
-        else:
-            return False
+        return self._fcost < other._fcost
+
+    def __le__(self, other):
+        """
+        Return True if the fcost of self is at most that of other
+
+        @type self: Node
+        @type other: Node
+        @rtype: bool
+        """
+        return self._fcost <= other._fcost
+
+    def __gt__(self, other):
+        """
+        Return True if the fcost of self is more than that of other
+
+        @type self: Node
+        @type other: Node
+        @rtype: bool
+        """
+        return self._fcost > other._fcost
+
+    def __ge__(self, other):
+        """
+        Return True if the fcost of self is at least that of other
+
+        @type self: Node
+        @type other: Node
+        @rtype: bool
+        """
+        return self._fcost >= other._fcost
 
     def __str__(self):
         """
@@ -190,6 +353,409 @@ class Node:
         return "{} {} {}".format(self.navigable, self.grid_x, self.grid_y)
 
 
+class IndexedHeap:
+    """
+    A binary min-heap of integer items, each with a priority.
+    The heap remembers where every item sits, so the priority of an
+    item already in the heap can be lowered in O(log n).
+
+    === Attributes: ===
+    @type _heap: list[list]
+       the heap itself, each entry is [priority, item]
+    @type _pos: dict[int, int]
+       _pos[item] is the position of item in _heap
+    """
+    def __init__(self):
+        """
+        Initialize an empty heap
+
+        @type self: IndexedHeap
+        @rtype: None
+
+        >>> h = IndexedHeap()
+        >>> len(h)
+        0
+        """
+        self._heap = []
+        self._pos = {}
+
+    def __len__(self):
+        """
+        Return the number of items in the heap
+
+        @type self: IndexedHeap
+        @rtype: int
+        """
+        return len(self._heap)
+
+    def __contains__(self, item):
+        """
+        Return True if item is in the heap, and false otherwise.
+
+        @type self: IndexedHeap
+        @type item: int
+        @rtype: bool
+        """
+        return item in self._pos
+
+    def push(self, item, priority):
+        """
+        Add item with the given priority
+
+        @type self: IndexedHeap
+        @type item: int
+        @type priority: object
+        @rtype: None
+
+        Precondition: item is not in the heap
+
+        >>> h = IndexedHeap()
+        >>> h.push(7, (3, 1))
+        >>> h.push(4, (2, 5))
+        >>> h.pop()
+        4
+        """
+        self._heap.append([priority, item])
+        self._pos[item] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def decrease_key(self, item, priority):
+        """
+        Lower the priority of an item already in the heap
+
+        @type self: IndexedHeap
+        @type item: int
+        @type priority: object
+        @rtype: None
+
+        Precondition: priority is not larger than the current priority
+
+        >>> h = IndexedHeap()
+        >>> h.push(1, 5)
+        >>> h.push(2, 6)
+        >>> h.decrease_key(2, 4)
+        >>> h.pop()
+        2
+        """
+        i = self._pos[item]
+        self._heap[i][0] = priority
+        self._sift_up(i)
+
+    def pop(self):
+        """
+        Remove and return the item with the smallest priority
+
+        @type self: IndexedHeap
+        @rtype: int
+
+        Precondition: the heap is not empty
+        """
+        heap = self._heap
+        last = heap.pop()
+        if not heap:
+            del self._pos[last[1]]
+            return last[1]
+        top = heap[0]
+        heap[0] = last
+        self._pos[last[1]] = 0
+        del self._pos[top[1]]
+        self._sift_down(0)
+        return top[1]
+
+    def peek(self):
+        """
+        Return the smallest priority in the heap, without removing it
+
+        @type self: IndexedHeap
+        @rtype: object
+
+        Precondition: the heap is not empty
+        """
+        return self._heap[0][0]
+
+    def remove(self, item):
+        """
+        Remove item from the heap
+
+        @type self: IndexedHeap
+        @type item: int
+        @rtype: None
+
+        Precondition: item is in the heap
+
+        >>> h = IndexedHeap()
+        >>> for item in [3, 1, 2]:
+        ...     h.push(item, item)
+        >>> h.remove(1)
+        >>> h.pop(), h.pop(), len(h)
+        (2, 3, 0)
+        """
+        i = self._pos.pop(item)
+        last = self._heap.pop()
+        if i < len(self._heap):
+            self._heap[i] = last
+            self._pos[last[1]] = i
+            self._sift_up(i)
+            self._sift_down(self._pos[last[1]])
+
+    def _sift_up(self, i):
+        """
+        Move the entry at position i up until the heap order holds
+        """
+        heap = self._heap
+        pos = self._pos
+        entry = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            above = heap[parent]
+            if entry[0] < above[0]:
+                heap[i] = above
+                pos[above[1]] = i
+                i = parent
+            else:
+                break
+        heap[i] = entry
+        pos[entry[1]] = i
+
+    def _sift_down(self, i):
+        """
+        Move the entry at position i down until the heap order holds
+        """
+        heap = self._heap
+        pos = self._pos
+        size = len(heap)
+        entry = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            below = heap[child]
+            if below[0] < entry[0]:
+                heap[i] = below
+                pos[below[1]] = i
+                i = child
+            else:
+                break
+        heap[i] = entry
+        pos[entry[1]] = i
+
+
+class NodeMap:
+    """
+    A read-only view of the cells of a Grid as Nodes, so that
+    map[x][y] is the Node with x-coordinate x and y-coordinate y.
+    Nodes are made on demand from the navigability buffer of the
+    grid, so no Node is kept per cell.
+
+    === Attributes: ===
+    @type grid: Grid
+       the grid this is a view of
+    """
+    def __init__(self, grid):
+        """
+        Initialize a view of grid
+
+        @type self: NodeMap
+        @type grid: Grid
+        @rtype: None
+        """
+        self.grid = grid
+
+    def __len__(self):
+        """
+        Return the width of the grid
+
+        @type self: NodeMap
+        @rtype: int
+        """
+        return self.grid.width
+
+    def __getitem__(self, x):
+        """
+        Return the column of Nodes with x-coordinate x, counting from
+        the right if x is negative, as a list does
+
+        @type self: NodeMap
+        @type x: int
+        @rtype: NodeColumn
+
+        >>> g = Grid("", ["B.++", ".+..", "...T"])
+        >>> print(g.map[1][1])
+        False 1 1
+        >>> print(g.map[-1][-1])
+        True 3 2
+        """
+        if x < 0:
+            x += self.grid.width
+        if not 0 <= x < self.grid.width:
+            raise IndexError("x-coordinate out of range")
+        return NodeColumn(self.grid, x)
+
+
+class NodeColumn:
+    """
+    One column of a NodeMap
+
+    === Attributes: ===
+    @type grid: Grid
+       the grid this is a view of
+    @type grid_x: int
+       the x-coordinate of the column
+    """
+    def __init__(self, grid, grid_x):
+        """
+        Initialize a view of column grid_x of grid
+
+        @type self: NodeColumn
+        @type grid: Grid
+        @type grid_x: int
+        @rtype: None
+        """
+        self.grid = grid
+        self.grid_x = grid_x
+
+    def __len__(self):
+        """
+        Return the height of the grid
+
+        @type self: NodeColumn
+        @rtype: int
+        """
+        return self.grid.height
+
+    def __getitem__(self, y):
+        """
+        Return the Node with coordinates grid_x, y, counting from the
+        bottom if y is negative, as a list does
+
+        @type self: NodeColumn
+        @type y: int
+        @rtype: Node
+        """
+        if y < 0:
+            y += self.grid.height
+        if not 0 <= y < self.grid.height:
+            raise IndexError("y-coordinate out of range")
+        return self.grid.node(self.grid_x, y)
+
+
+class DistanceField:
+    """
+    The costs of the shortest paths from one source node to the nodes
+    of a Grid, found by Dijkstra's algorithm with the step costs of
+    Node.distance. The search only runs as far as it has been asked
+    to, and picks up where it stopped when asked for more.
+
+    === Attributes: ===
+    @type grid: Grid
+       the grid the field covers
+    @type source: int
+       the index y * width + x of the source node
+    @type version: int
+       the map_version of grid the field was computed on
+    @type dist: array[int]
+       dist[i] is the cost of the shortest path to the node with index
+       i, or -1 if that node is not settled yet
+    @type parent: array[int]
+       parent[i] is the index of the node before i on that path
+    """
+    def __init__(self, grid, source):
+        """
+        Initialize a field of grid from the node with index source
+
+        @type self: DistanceField
+        @type grid: Grid
+        @type source: int
+        @rtype: None
+        """
+        size = grid.width * grid.height
+        self.grid = grid
+        self.source = source
+        self.version = grid.map_version
+        self.dist = array("i", [-1]) * size
+        self.parent = array("i", [-1]) * size
+        self._cost = array("i", [UNREACHED]) * size
+        self._cost[source] = 0
+        self._heap = IndexedHeap()
+        self._heap.push(source, 0)
+
+    def settle(self, targets, settle_all=True):
+        """
+        Continue the search until all the nodes with indices in targets
+        are settled, or just one of them if settle_all is False, or
+        until every reachable node is settled. If targets is None, the
+        search runs until every reachable node is settled. Return the
+        index of the last target settled, or -1 if none was.
+
+        @type self: DistanceField
+        @type targets: list[int] | None
+        @type settle_all: bool
+        @rtype: int
+        """
+        grid = self.grid
+        masks = grid.neighbour_masks()
+        moves = grid._moves
+        costs = grid.costs
+        dist = self.dist
+        parent = self.parent
+        cost = self._cost
+        heap = self._heap
+        everything = targets is None
+        if everything:
+            targets = []
+        waiting = {index for index in targets if dist[index] == -1}
+        settled = [index for index in targets if dist[index] != -1]
+        last = -1
+        if settled:
+            # nodes still unsettled are no closer than any settled one
+            last = max(settled, key=lambda index: dist[index]) \
+                if settle_all else min(settled, key=lambda index: dist[index])
+            if not settle_all:
+                return last
+        while (waiting or everything) and len(heap) > 0:
+            current = heap.pop()
+            g = cost[current]
+            dist[current] = g
+            here = costs[current]
+            for offset, dx, dy, step in moves[masks[current]]:
+                index = current + offset
+                if dist[index] != -1:
+                    continue
+                fee = g + (step >> 1) * (here + costs[index])
+                if fee < cost[index]:
+                    if cost[index] == UNREACHED:
+                        heap.push(index, fee)
+                    else:
+                        heap.decrease_key(index, fee)
+                    cost[index] = fee
+                    parent[index] = current
+            if current in waiting:
+                waiting.discard(current)
+                last = current
+                if not settle_all:
+                    return last
+        return last if not waiting else -1
+
+    def distance(self, node):
+        """
+        Return the cost of the shortest path from the source to node,
+        settling node first if needed, or None if node is unreachable
+
+        @type self: DistanceField
+        @type node: Node
+        @rtype: int | None
+
+        >>> g = Grid("", ["B.++", ".+..", "...T"])
+        >>> g.distance_map(g.boat).distance(g.treasure)
+        38
+        """
+        index = node.grid_y * self.grid.width + node.grid_x
+        self.settle([index])
+        return None if self.dist[index] == -1 else self.dist[index]
+
+
 class Grid:
     """
     Represents the world where the action of the game takes place.
@@ -204,21 +770,80 @@ class Grid:
        represents the height of the game map in lines
        the y-coordinate runs along height; the topmost
        line contains nodes with y-coordinate 0
-    @type map: List[List[Node]]
+    @type map: NodeMap
        map[x][y] is a Node with x-coordinate equal to x
        running from 0 to width-1
        and y-coordinate running from 0 to height-1
+    @type nav: bytearray
+       nav[y * width + x] is 1 if the node with coordinates x, y is
+       navigable, and 0 otherwise
+    @type costs: bytearray
+       costs[y * width + x] is the cost of the node with coordinates
+       x, y given by the legend of the map, see __init__
+    @type weighted: bool
+       whether the legend gave any node a cost other than 1
     @type treasure: Node
        a navigable node in the map, the location of the treasure
     @type boat: Node
        a navigable node in the map, the current location of the boat
+    @type expanded: int
+       the number of nodes expanded by the last call to find_path
+    @type version: int
+       goes up by one every time the map changes or the boat moves
+    @type map_version: int
+       goes up by one every time the map changes, whether a node or
+       corner cutting, but not when the boat moves
+    @type field_cache_size: int
+       how many distance fields distance_map keeps for reuse
+    @type path_cache_size: int
+       how many paths find_path keeps for reuse, 0 to keep none
+    @type path_cache_ttl: float | None
+       how many seconds a cached path stays usable, or None for ever
+    @type path_cache_stats: dict[str, int]
+       the number of "hits", "misses" and "evictions" of the path cache
+    @type planner: DStarLite | None
+       the incremental planner attached to this grid, if any, which is
+       told about every move and map change, see dstar.py
+    @type index: SpatialIndex | None
+       the spatial index attached to this grid, if any, which is told
+       about every move of the boat, see spatial.py
+    @type corner_cutting: bool
+       whether a path may pass diagonally between two islands that
+       touch at a corner, see set_corner_cutting
+    @type instrumented: bool
+       whether searches update counters and timers and call trace
+    @type trace: ((int, int) -> None) | None
+       called with the coordinates of each node a search expands, in
+       order, while instrumented
+    @type counters: dict[str, int]
+       totals over the searches of find_path while instrumented, by
+       the names in COUNTERS, see instrument
+    @type timers: dict[str, float]
+       seconds spent in each phase, by the names in TIMERS; parse is
+       always timed, the others only while instrumented
 
     === Representation invariants ===
     - width and height are positive integers
     - map has dimensions width, height
+    - nav has length width * height
+
+    The text map is kept in the bytearray _canvas, rows separated by
+    newlines, so moves and plotted paths write single bytes in place
+    and __str__ decodes it in one go. _island and _sea are the
+    characters set_navigable writes there, ones the legend maps to an
+    island and to sea costing 1, see _legend_marks.
+
+    The search state of find_path (gcost and parent of each node) is
+    kept in the typed arrays _gcost and _parent, parallel to nav, and
+    hcost is computed from the coordinates when it is needed. _stamp
+    records in which search each entry was written, see _new_search.
+    _labels holds the body of water of each node, see component.
+    _linked holds the Nodes of the last path linked, see node.
+    _masks holds which neighbours of each node can be stepped to, see
+    neighbour_masks.
     """
 
-    def __init__(self, file_path, text_grid=None):
+    def __init__(self, file_path, text_grid=None, legend=None):
         """
         If text_grid is None, initialize a new Grid assuming file_path
         contains pathname to a text file with the following format:
@@ -241,61 +866,276 @@ class Grid:
            - it should be ignored if text_grid is not None.
            - the file specified by file_path should exists, so there
              is no need for error handling
-           Please call open_grid to open the file
+           The file is memory-mapped by read_rows, and each row is
+           parsed straight into nav, finding B and T in the same pass
         @type text_grid: List[str]
+        @type legend: dict[str, int | None] | None
+           maps a map character to the cost of crossing a node marked
+           with it, from 1 to MAX_COST, or to None for an island. It is
+           merged over LEGEND, so "+" stays an island unless legend
+           says otherwise, and any character in neither is sea
+           costing 1.
+           A step between two nodes costs its length, 10 or 14, times
+           the mean of their costs, so shallow water, currents and
+           restricted zones can be made dearer than open sea.
         @rtype: None
+
+        >>> g = Grid("", ["B~~T", "...."], {"~": 3})
+        >>> g.find_path(g.boat, g.treasure)
+        True
+        >>> [str(n) for n in g.retrace_path(g.boat, g.treasure)]
+        ['True 1 1', 'True 2 1', 'True 3 0']
+        >>> g.treasure.gcost
+        38
         """
+        begin = time.perf_counter()
+        nav_table, cost_table = _legend_tables(legend)
         if file_path == "":
-            self.text_grid = text_grid
+            rows = (row.encode("ascii") for row in text_grid)
         else:
-            final_list = []
-            file = open(file_path)
-            for line in file.read().splitlines():
-                if line != "":
-                    final_list.append(line)
-                    self.text_grid = final_list
-        self.width = len(text_grid[0])
-        self.height = len(text_grid)
-
-        empty_map = []
-        for i in range(self.width):
-            x_map = []
-            counter_y = 0
-            for k in text_grid:
-                z = list(k)
-                x = z[i]
-                if x == "+":
-                    node = Node(False, i, counter_y)
-                else:
-                    node = Node(True, i, counter_y)
-                x_map.append(node)
-                counter_y += 1
-            empty_map.append(x_map)
-        self.map = empty_map
-
-        found_tresure = False
-        found_boat = False
+            rows = self.read_rows(file_path)
+
+        canvas = bytearray()
+        nav = bytearray()
+        costs = None if cost_table is None else bytearray()
+        self.boat = None
+        self.treasure = None
         counter_y = 0
-        counter_x = 0
-
-        while found_tresure is False or found_boat is False:
-            row = text_grid[counter_y]
-            lofrow = list(row)
-            while (found_tresure is False or found_boat is False) and counter_x < \
-                    self.width:
-                point = lofrow[counter_x]
-                if point == "T":
-                    self.treasure = Node(True, counter_x, counter_y)
-                    found_tresure = True
-                    counter_x += 1
-                elif point == "B":
+        for row in rows:
+            canvas += row + b"\n"
+            nav += row.translate(nav_table)
+            if costs is not None:
+                costs += row.translate(cost_table)
+            if self.boat is None:
+                counter_x = row.find(b"B")
+                if counter_x != -1:
                     self.boat = Node(True, counter_x, counter_y)
-                    found_boat = True
-                    counter_x += 1
-                else:
-                    counter_x += 1
+            if self.treasure is None:
+                counter_x = row.find(b"T")
+                if counter_x != -1:
+                    self.treasure = Node(True, counter_x, counter_y)
             counter_y += 1
-            counter_x = 0
+        if self.boat is None or self.treasure is None:
+            raise ValueError("the map needs both a boat and a treasure")
+        del canvas[-1:]
+        self._text = canvas
+        self._setup(len(nav) // counter_y, counter_y, nav, costs)
+        self._island, self._sea = _legend_marks(nav_table, cost_table)
+        if self._sea is not None:
+            self._under = self._sea
+        self.timers["parse"] = time.perf_counter() - begin
+
+    def _setup(self, width, height, nav, costs=None):
+        """
+        Set the dimensions, navigability buffer and cost plane of this
+        grid, and clear its search state. Without costs every node
+        costs 1.
+
+        @type self: Grid
+        @type width: int
+        @type height: int
+        @type nav: bytearray
+        @type costs: bytearray | None
+        @rtype: None
+        """
+        self.width = width
+        self.height = height
+        self.nav = nav
+        self.weighted = costs is not None
+        if costs is None:
+            costs = bytearray(b"\x01") * (width * height)
+        self.costs = costs
+        self._island = ord("+")
+        self._sea = ord(".")
+        self._under = ord(".")
+        self.map = NodeMap(self)
+        self._gcost = None
+        self._parent = None
+        self._stamp = None
+        self._generation = 0
+        self._labels = None
+        self._linked = {}
+        self._sizes = None
+        self._next_label = 1
+        self.expanded = 0
+        self.version = 0
+        self.map_version = 0
+        self.planner = None
+        self.index = None
+        self.field_cache_size = FIELD_CACHE_SIZE
+        self._fields = OrderedDict()
+        self.path_cache_size = PATH_CACHE_SIZE
+        self.path_cache_ttl = None
+        self.path_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._paths = OrderedDict()
+        self._executor = None
+        self._lock = threading.RLock()
+        self._pool = None
+        self._searches = {}
+        self.instrumented = False
+        self.trace = None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.timers = dict.fromkeys(TIMERS, 0.0)
+        self.corner_cutting = True
+        self._masks = None
+        self._moves = [tuple((dy * width + dx, dx, dy, step)
+                             for k, (dx, dy, step) in enumerate(STEPS)
+                             if mask >> k & 1)
+                       for mask in range(256)]
+
+    @classmethod
+    def from_plane(cls, width, height, nav, boat, treasure, costs=None):
+        """
+        Return a new Grid with the given navigability buffer, boat and
+        treasure, and cost plane if given, without parsing a text map.
+        The text map is rebuilt from nav, using only the characters
+        ".", "+", "B" and "T", the first time it is needed, so a grid
+        that is only searched never builds it.
+
+        @type width: int
+        @type height: int
+        @type nav: bytearray
+        @type boat: Node
+        @type treasure: Node
+        @type costs: bytearray | None
+        @rtype: Grid
+
+        >>> g = Grid.from_plane(3, 2, bytearray([1, 0, 1, 1, 1, 1]),
+        ...                     Node(True, 0, 0), Node(True, 2, 1))
+        >>> print(g)
+        B+.
+        ..T
+        """
+        grid = cls.__new__(cls)
+        grid._text = None
+        grid.boat = boat
+        grid.treasure = treasure
+        grid._setup(width, height, nav, costs)
+        return grid
+
+    def save_compiled(self, path):
+        """
+        Save this grid to path in the compiled map format: a header
+        with the dimensions, boat and treasure, followed by nav packed
+        eight cells to a byte, first cell in the highest bit, and then
+        by costs if the grid is weighted.
+
+        @type self: Grid
+        @type path: str
+        @rtype: None
+        """
+        with open(path, "wb") as file:
+            file.write(COMPILED_HEADER.pack(
+                COMPILED_MAGIC, COMPILED_VERSION,
+                COMPILED_WEIGHTED if self.weighted else 0,
+                self.width, self.height, self.boat.grid_x, self.boat.grid_y,
+                self.treasure.grid_x, self.treasure.grid_y))
+            file.write(_pack_bits(self.nav))
+            if self.weighted:
+                file.write(self.costs)
+
+    @property
+    def _canvas(self):
+        """
+        Return the text map, building it from nav, the boat and the
+        treasure if it has not been built yet, see from_plane
+
+        @type self: Grid
+        @rtype: bytearray
+        """
+        if self._text is None:
+            width = self.width
+            text = self.nav.translate(TEXT_TABLE)
+            text[self.boat.grid_y * width + self.boat.grid_x] = ord("B")
+            text[self.treasure.grid_y * width + self.treasure.grid_x] = \
+                ord("T")
+            self._text = bytearray(b"\n").join(
+                text[y * width:(y + 1) * width] for y in range(self.height))
+        return self._text
+
+    @classmethod
+    def load_compiled(cls, path):
+        """
+        Return the Grid saved to path by save_compiled. The file is
+        memory-mapped, and the packed plane is expanded into nav
+        straight from the mapping, see _unpack_bits. The text map is
+        only built when it is first needed, see from_plane.
+
+        A file shorter than its header says, or whose boat or treasure
+        is off the map or on an island, raises ValueError.
+
+        @type path: str
+        @rtype: Grid
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "chart.grid")
+        >>> Grid("", ["B.++", ".+..", "...T"]).save_compiled(path)
+        >>> print(Grid.load_compiled(path).plot_path(
+        ...     Node(True, 0, 0), Node(True, 3, 2)))
+        B*++
+        .+*.
+        ...T
+        >>> with open(path, "r+b") as file:
+        ...     file.truncate(os.path.getsize(path) - 1)
+        33
+        >>> Grid.load_compiled(path)  # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+        ...
+        ValueError: truncated compiled map: ...
+        """
+        with open(path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if len(data) < COMPILED_HEADER.size:
+                    raise ValueError("not a compiled map: {}".format(path))
+                magic, version, flags, width, height, bx, by, tx, ty = \
+                    COMPILED_HEADER.unpack_from(data)
+                if magic != COMPILED_MAGIC or version != COMPILED_VERSION:
+                    raise ValueError("not a compiled map: {}".format(path))
+                size = width * height
+                pad = -size % 8
+                end = COMPILED_HEADER.size + (size + pad) // 8
+                if len(data) < end + (size if flags & COMPILED_WEIGHTED
+                                      else 0):
+                    raise ValueError("truncated compiled map: {}".format(path))
+                with memoryview(data)[COMPILED_HEADER.size:end] as plane:
+                    nav = _unpack_bits(plane, size)
+                costs = None
+                if flags & COMPILED_WEIGHTED:
+                    costs = bytearray(data[end:end + size])
+        for x, y in [(bx, by), (tx, ty)]:
+            if not (x < width and y < height) or nav[y * width + x] != 1:
+                raise ValueError("the boat and treasure must be on the sea "
+                                 "of the map: {}".format(path))
+        return cls.from_plane(width, height, nav, Node(True, bx, by),
+                              Node(True, tx, ty), costs)
+
+    def node(self, grid_x, grid_y):
+        """
+        Return the Node for the cell with coordinates grid_x, grid_y:
+        the one linked there by the last path found, if any, so that
+        map[x][y] follows the path through parent as it always has,
+        or else a new one
+
+        @type self: Grid
+        @type grid_x: int
+        @type grid_y: int
+        @rtype: Node
+
+        >>> g = Grid("", ["B.++", ".+..", "...T"])
+        >>> print(g.node(2, 0))
+        False 2 0
+        >>> g.find_path(g.map[0][0], g.map[3][2])
+        True
+        >>> [str(n) for n in g.retrace_path(g.map[0][0], g.map[3][2])]
+        ['True 1 0', 'True 2 1', 'True 3 2']
+        >>> print(g.map[3][2].parent)
+        True 2 1
+        """
+        node = self._linked.get((grid_x, grid_y))
+        if node is not None:
+            return node
+        return Node(self.nav[grid_y * self.width + grid_x] == 1,
+                    grid_x, grid_y)
 
     @classmethod
     def open_grid(cls, file_path):
@@ -304,6 +1144,31 @@ class Grid:
         """
         return open(file_path)
 
+    @classmethod
+    def read_rows(cls, file_path):
+        """
+        Yield the non-empty rows of the map file at file_path as bytes,
+        without the line endings. The file is memory-mapped, so only
+        the current row is copied into memory.
+
+        @type file_path: str
+        @rtype: Iterator[bytes]
+        """
+        with open(file_path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                size = len(data)
+                begin = 0
+                while begin < size:
+                    end = data.find(b"\n", begin)
+                    if end == -1:
+                        end = size
+                    row = data[begin:end].rstrip(b"\r")
+                    if row:
+                        yield row
+                    begin = end + 1
+
     def __str__(self):
         """
         Return a string representation.
@@ -317,29 +1182,89 @@ class Grid:
         .+..
         ...T
         """
-        final = ""
-        for text in self.text_grid:
-            final += str(text) + "\n"
-        return final.rstrip()
+        return self._canvas.decode("ascii")
 
-    def move_helper(self, x, y):
-        a = self.boat.grid_x
-        a_ = a + x
+    @property
+    def text_grid(self):
+        """
+        Return the rows of the text map as a list of strings, as given
+        to __init__
+
+        @type self: Grid
+        @rtype: list[str]
+
+        >>> Grid("", ["B.++", ".+..", "...T"]).text_grid
+        ['B.++', '.+..', '...T']
+        """
+        return str(self).split("\n")
+
+    def to_bytes(self):
+        """
+        Return the text map as a read-only view of the bytes behind it,
+        rows separated by newlines, without copying it
+
+        @type self: Grid
+        @rtype: memoryview
+
+        >>> bytes(Grid("", ["B.++", ".+..", "...T"]).to_bytes())
+        b'B.++\\n.+..\\n...T'
+        """
+        return memoryview(self._canvas).toreadonly()
+
+    def _offset(self, grid_x, grid_y):
+        """
+        Return where the character of the node with coordinates grid_x,
+        grid_y is in the text map
+
+        @type self: Grid
+        @type grid_x: int
+        @type grid_y: int
+        @rtype: int
+        """
+        return grid_y * (self.width + 1) + grid_x
+
+    def viewport(self, radius):
+        """
+        Return the part of the text map within radius nodes of the boat
+        in each direction, as a string
+
+        @type self: Grid
+        @type radius: int
+        @rtype: str
+
+        >>> g = Grid("", ["......", "..+...", "...B..", "......", ".....T"])
+        >>> print(g.viewport(1))
+        +..
+        .B.
+        ...
+        """
+        x0 = max(0, self.boat.grid_x - radius)
+        x1 = min(self.width, self.boat.grid_x + radius + 1)
+        rows = []
+        for y in range(max(0, self.boat.grid_y - radius),
+                       min(self.height, self.boat.grid_y + radius + 1)):
+            rows.append(self._canvas[self._offset(x0, y):self._offset(x1, y)])
+        return b"\n".join(rows).decode("ascii")
+
+    def move_helper(self, x, y):
+        a = self.boat.grid_x
+        a_ = a + x
         b = self.boat.grid_y
         b_ = b - y
-        if self.map[a_][b_].navigable is True \
-                and self.width >= a_ >= 0 \
-                and self.height >= b_ >= 0:
+        if self.width > a_ >= 0 \
+                and self.height > b_ >= 0 \
+                and self.nav[b_ * self.width + a_] == 1:
+            canvas = self._canvas
             self.boat = Node(True, a_, b_)
-            row = self.text_grid[b]
-            row = list(row)
-            other_row = self.text_grid[b_]
-            other_row = list(other_row)
-            other_row[a_], row[a] = row[a], other_row[a_]
-            new_row = "".join(row)
-            new_other_row = "".join(other_row)
-            self.text_grid[b] = new_row
-            self.text_grid[b_] = new_other_row
+            self.version += 1
+            if self.planner is not None:
+                self.planner.move_start(self.boat)
+            if self.index is not None:
+                self.index.move_boat(self.boat)
+            there = self._offset(a_, b_)
+            canvas[self._offset(a, b)] = self._under
+            self._under = canvas[there]
+            canvas[there] = ord("B")
         else:
             raise ValueError("sorry m8, path cannot be manuevered")
 
@@ -398,13 +1323,159 @@ class Grid:
                 if x == 0 and y == 0:
                     pass
                 elif a_ >= 0 and a_ < self.width and b_ >= 0 and b_ < self.height:
-                    neighbour = self.map[a_][b_]
-                    community.append(neighbour)
+                    community.append(self.node(a_, b_))
                 else:
                     pass
         return community
 
-    def find_path(self, start_node, target_node):
+    def neighbours(self, node):
+        """
+        Return the neighbours node can step to, as pairs of the
+        neighbouring Node and the cost of the step to it, read from
+        the neighbour mask of node
+
+        @type self: Grid
+        @type node: Node
+        @rtype: list[(Node, int)]
+
+        >>> g = Grid("", ["B.++", ".+..", "...T"])
+        >>> [(str(n), cost) for n, cost in g.neighbours(g.node(2, 1))]
+        [('True 1 2', 14), ('True 1 0', 14), ('True 2 2', 10), \
+('True 3 2', 14), ('True 3 1', 10)]
+        """
+        width = self.width
+        index = node.grid_y * width + node.grid_x
+        return [(self.node((index + offset) % width,
+                           (index + offset) // width), step)
+                for offset, dx, dy, step in
+                self._moves[self.neighbour_masks()[index]]]
+
+    def neighbour_masks(self):
+        """
+        Return the neighbour masks of this grid, worked out the first
+        time they are needed. Bit k of masks[y * width + x] is set if
+        the step STEPS[k] from x, y stays on the map and ends on the
+        sea, and, unless corner_cutting is True, does not pass between
+        two islands. Searches look up the steps of a node by its mask
+        in _moves, instead of checking each neighbour.
+
+        @type self: Grid
+        @rtype: bytearray
+        """
+        if self._masks is None:
+            self._masks = bytearray()
+            for y in range(0, self.height, MASK_BAND):
+                self._masks += self._band_masks(y, min(self.height,
+                                                       y + MASK_BAND))
+        return self._masks
+
+    def _band_masks(self, y0, y1):
+        """
+        Return the neighbour masks of rows y0 to y1. Every plane of
+        neighbours is nav shifted by the offset of a step, so each is
+        worked out for the whole band at once on big integers, a byte
+        per node.
+
+        @type self: Grid
+        @type y0: int
+        @type y1: int
+        @rtype: bytes
+        """
+        width = self.width
+        top = max(0, y0 - 1)
+        bottom = min(self.height, y1 + 1)
+        size = (bottom - top) * width
+        full = (1 << 8 * size) - 1
+        plane = int.from_bytes(self.nav[top * width:bottom * width], "big")
+        rows = bottom - top
+        left = int.from_bytes((b"\x00" + b"\x01" * (width - 1)) * rows, "big")
+        right = int.from_bytes((b"\x01" * (width - 1) + b"\x00") * rows,
+                               "big")
+        shifted = {}
+        for dx, dy, step in STEPS:
+            offset = dy * width + dx
+            if offset > 0:
+                near = (plane << 8 * offset) & full
+            else:
+                near = plane >> -8 * offset
+            if dx == 1:
+                near &= right
+            elif dx == -1:
+                near &= left
+            shifted[dx, dy] = near
+        masks = 0
+        for k, (dx, dy, step) in enumerate(STEPS):
+            near = shifted[dx, dy]
+            if dx != 0 and dy != 0 and not self.corner_cutting:
+                near &= shifted[dx, 0] | shifted[0, dy]
+            masks |= near << k
+        return masks.to_bytes(size, "big")[(y0 - top) * width:
+                                            (y1 - top) * width]
+
+    def _cell_mask(self, grid_x, grid_y):
+        """
+        Return the neighbour mask of the node with coordinates grid_x,
+        grid_y, see neighbour_masks
+
+        @type self: Grid
+        @type grid_x: int
+        @type grid_y: int
+        @rtype: int
+        """
+        width = self.width
+        nav = self.nav
+        mask = 0
+        for k, (dx, dy, step) in enumerate(STEPS):
+            x = grid_x + dx
+            y = grid_y + dy
+            if not (0 <= x < width and 0 <= y < self.height) or \
+                    nav[y * width + x] == 0:
+                continue
+            if dx != 0 and dy != 0 and not self.corner_cutting and \
+                    nav[grid_y * width + x] == 0 and \
+                    nav[y * width + grid_x] == 0:
+                continue
+            mask |= 1 << k
+        return mask
+
+    def set_corner_cutting(self, allowed):
+        """
+        Allow paths to pass diagonally between two islands that touch
+        at a corner, or not if allowed is False. Cached paths and
+        distance fields are dropped, as after a change to the map, and
+        an attached planner is told of each node whose steps changed.
+
+        Jump Point Search always cuts corners, so find_path uses A-star
+        for "jps" while corner cutting is not allowed, as it does on a
+        weighted grid.
+
+        @type self: Grid
+        @type allowed: bool
+        @rtype: None
+
+        >>> g = Grid("", ["B+..", "+.+.", "...T"])
+        >>> g.find_path(g.boat, g.treasure)
+        True
+        >>> g.set_corner_cutting(False)
+        >>> g.find_path(g.boat, g.treasure)
+        False
+        """
+        with self._lock:
+            if allowed == self.corner_cutting:
+                return
+            before = None if self.planner is None else self.neighbour_masks()
+            self.corner_cutting = allowed
+            self._masks = None
+            self.version += 1
+            self.map_version += 1
+            if before is not None:
+                width = self.width
+                for index, mask in enumerate(self.neighbour_masks()):
+                    if mask != before[index]:
+                        self.planner.update_cell(index % width,
+                                                 index // width)
+
+    def find_path(self, start_node, target_node, algorithm="astar"):
         """
         Implement the A-star path search algorithm
         If you will add a new node to the path, don't forget to set the parent.
@@ -417,44 +1488,1142 @@ class Grid:
            The starting node of the path
         @type target_node: Node
            The target node of the path
+        @type algorithm: str
+           "astar" for plain A-star, or "jps" for Jump Point Search,
+           which finds a path of the same length while expanding only
+           the nodes where the path may turn
+        @rtype: bool
+           True if and only if a path was found
+
+        The open set is an IndexedHeap ordered by fcost, then hcost,
+        so picking the next node and updating a cheaper route are both
+        O(log n). Whether a node is open or closed is kept in a flat
+        array indexed by y * width + x, so checking it is O(1).
+        The search state on the grid is stamped with a generation
+        number, so a new search never has to reset it. If start_node
+        and target_node lie in different bodies of water, find_path
+        returns False at once, see component. If the same path was
+        found since the map last changed, or a cached distance field
+        from start_node already settled target_node, the path is taken
+        from the cache without a search, see distance_map.
+
+        >>> g = Grid("", ["B..+....", ".+.+.++.", ".+...+.T"])
+        >>> g.find_path(g.boat, g.treasure)
+        True
+        >>> astar_cost = g.treasure.gcost
+        >>> g = Grid("", ["B..+....", ".+.+.++.", ".+...+.T"])
+        >>> g.find_path(g.boat, g.treasure, "jps")
+        True
+        >>> g.treasure.gcost == astar_cost
+        True
+        >>> [str(n) for n in g.retrace_path(g.boat, g.treasure)]
+        ['True 1 0', 'True 2 1', 'True 3 2', 'True 4 1', 'True 5 0', \
+'True 6 0', 'True 7 1', 'True 7 2']
+        >>> g.find_path(g.boat, g.treasure)
+        True
+        >>> g.path_cache_stats
+        {'hits': 1, 'misses': 1, 'evictions': 0}
+        >>> g.move("S")
+        >>> g.find_path(g.node(0, 0), g.treasure)
+        True
+        >>> g.path_cache_stats
+        {'hits': 2, 'misses': 1, 'evictions': 0}
+        """
+        if self.instrumented:
+            begin = time.perf_counter()
+        corners = self._route(start_node, target_node, algorithm)
+        if self.instrumented:
+            middle = time.perf_counter()
+            self.timers["search"] += middle - begin
+        if corners is None:
+            target_node.set_parent(None)
+            self._linked = {}
+            return False
+        start_node.set_gcost(0)
+        start_node.set_hcost(start_node.distance(target_node))
+        start_node.set_parent(None)
+        self._link_indices(start_node, target_node, self._expand(corners))
+        if self.instrumented:
+            self.timers["retrace"] += time.perf_counter() - middle
+        return True
+
+    def instrument(self, enabled=True, trace=None):
+        """
+        Turn instrumentation of find_path on, or off if enabled is
+        False, and set counters and the timers of search and retrace
+        back to zero. While it is on, each search adds to counters:
+
+        - searches: the searches run, not taken from a cache
+        - expanded: the nodes taken off the open set
+        - pushes: the nodes put on the open set
+        - reopened: the times an open node was given a cheaper path
+        - evaluated: the neighbours whose path cost was worked out
+
+        and trace, if given, is called with the coordinates of every
+        node expanded, in order, for a heatmap of the search. When it
+        is off, the searches only check one flag for it.
+
+        @type self: Grid
+        @type enabled: bool
+        @type trace: ((int, int) -> None) | None
+        @rtype: None
+
+        >>> g = Grid("", ["B.++", ".+..", "...T"])
+        >>> order = []
+        >>> g.instrument(trace=lambda x, y: order.append((x, y)))
+        >>> g.find_path(g.boat, g.treasure)
+        True
+        >>> g.counters
+        {'searches': 1, 'expanded': 4, 'pushes': 8, 'reopened': 0, \
+'evaluated': 8}
+        >>> order
+        [(0, 0), (1, 0), (2, 1), (3, 2)]
+        """
+        self.instrumented = enabled
+        self.trace = trace if enabled else None
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.timers["search"] = 0.0
+        self.timers["retrace"] = 0.0
+
+    def _count(self, expanded, pushes, reopened, evaluated):
+        """
+        Add the counts of a search to counters
+
+        @type self: Grid
+        @type expanded: int
+        @type pushes: int
+        @type reopened: int
+        @type evaluated: int
         @rtype: None
         """
-        open_list = []
-        closed_list = []
+        counters = self.counters
+        counters["searches"] += 1
+        counters["expanded"] += expanded
+        counters["pushes"] += pushes
+        counters["reopened"] += reopened
+        counters["evaluated"] += evaluated
+
+    def iter_path(self, start_node, target_node, turns=False,
+                  algorithm="astar"):
+        """
+        Yield the nodes of the shortest path from start_node to
+        target_node in order, without start_node, like retrace_path, or
+        nothing if there is no path. If turns is True, only the nodes
+        where the path changes direction are yielded, and target_node.
+
+        The path is searched for as by find_path when the first node is
+        asked for, but only its turning points are kept, and the nodes
+        between them are made one at a time, so a long route that is
+        only read in part costs no more than its number of turns.
+
+        @type self: Grid
+        @type start_node: Node
+        @type target_node: Node
+        @type turns: bool
+        @type algorithm: str
+        @rtype: Iterator[Node]
+
+        >>> g = Grid("", ["B.......", "++++++.+", "T......."])
+        >>> [str(n) for n in g.iter_path(g.boat, g.treasure)]
+        ['True 1 0', 'True 2 0', 'True 3 0', 'True 4 0', 'True 5 0', \
+'True 6 1', 'True 5 2', 'True 4 2', 'True 3 2', 'True 2 2', 'True 1 2', \
+'True 0 2']
+        >>> [str(n) for n in g.iter_path(g.boat, g.treasure, True)]
+        ['True 5 0', 'True 6 1', 'True 5 2', 'True 0 2']
+        """
+        corners = self._route(start_node, target_node, algorithm)
+        if corners is None:
+            return
+        width = self.width
+        if turns:
+            indices = corners[1:]
+        else:
+            indices = self._expand(corners)
+        for index in indices:
+            yield self.node(index % width, index // width)
+
+    def _route(self, start_node, target_node, algorithm="astar", stop=None):
+        """
+        Find the shortest path from start_node to target_node as
+        find_path does, without linking any Nodes, and return the
+        indices of its turning points from start_node to target_node,
+        or None if there is no path. See _corners.
+
+        If stop is given, the search calls it every STOP_INTERVAL
+        expanded nodes, and gives up, returning None, once it is True.
+
+        The search state and the caches are shared by every search on
+        this grid, so _route holds _lock while it uses them, and a
+        search from find_path waits for one running for
+        find_path_async, or the other way round.
+
+        @type self: Grid
+        @type start_node: Node
+        @type target_node: Node
+        @type algorithm: str
+        @type stop: (() -> bool) | None
+        @rtype: array[int] | None
+        """
+        if algorithm not in ["astar", "jps"]:
+            raise ValueError("unknown algorithm: {}".format(algorithm))
+        with self._lock:
+            self.expanded = 0
+            if self.component(start_node) == 0 or \
+                    self.component(start_node) != self.component(target_node):
+                return None
+            width = self.width
+            start = start_node.grid_y * width + start_node.grid_x
+            target = target_node.grid_y * width + target_node.grid_x
+            field = self._cached_field(start_node, target_node)
+            if field is not None:
+                return self._corners(start, target, field.parent)
+            key = (start, target, self.map_version)
+            corners = self._cached_path(key)
+            if corners is not None:
+                return corners
+            if algorithm == "jps" and self.corner_cutting and \
+                    not self.weighted:
+                found = self._jump_point_search(start_node, target_node, stop)
+            else:
+                found = self._a_star(start_node, target_node, stop)
+            if not found:
+                return None
+            corners = self._corners(start, target, self._parent)
+            self._cache_path(key, corners)
+            return corners
+
+    def _corners(self, start, target, parents):
+        """
+        Follow parents back from target to start and return the indices
+        of start, of every node where the path turns, and of target, in
+        that order. Between two of them the path runs in a straight or
+        diagonal line, so parents may also skip along such lines, as
+        they do between jump points.
+
+        @type self: Grid
+        @type start: int
+        @type target: int
+        @type parents: array[int]
+        @rtype: array[int]
+        """
+        width = self.width
+        corners = array("i", [target])
+        heading = None
+        index = target
+        while index != start:
+            before = parents[index]
+            x = index % width
+            y = index // width
+            step = ((x > before % width) - (x < before % width),
+                    (y > before // width) - (y < before // width))
+            if heading is not None and step != heading:
+                corners.append(index)
+            heading = step
+            index = before
+        if target != start:
+            corners.append(start)
+        corners.reverse()
+        return corners
+
+    def _expand(self, corners):
+        """
+        Yield the indices of the nodes on the path through corners, as
+        returned by _corners, one step at a time, without the first
+
+        @type self: Grid
+        @type corners: array[int]
+        @rtype: Iterator[int]
+        """
+        width = self.width
+        for i in range(1, len(corners)):
+            index = corners[i - 1]
+            end = corners[i]
+            dx = (end % width > index % width) - (end % width < index % width)
+            dy = (end // width > index // width) - \
+                (end // width < index // width)
+            step = dy * width + dx
+            while index != end:
+                index += step
+                yield index
+
+    def _a_star(self, start_node, target_node, stop=None):
+        """
+        Run A-star from start_node to target_node, see find_path and
+        _route
+
+        @type self: Grid
+        @type start_node: Node
+        @type target_node: Node
+        @type stop: (() -> bool) | None
+        @rtype: bool
+        """
+        width = self.width
+        masks = self.neighbour_masks()
+        moves = self._moves
+        costs = self.costs
+        opened, closed = self._new_search()
+        gcost = self._gcost
+        parent = self._parent
+        stamp = self._stamp
+        tx = target_node.grid_x
+        ty = target_node.grid_y
+        start = start_node.grid_y * width + start_node.grid_x
+        target = ty * width + tx
         start_node.set_gcost(0)
-        start_node.set_hcost(0)
-        open_list.append(start_node)
-        treasure = False
-
-        while treasure is False:
-            current_node = open_list[0]
-            for i in open_list:
-                if (i.fcost() < current_node.fcost()) or (i.fcost() == current_node.fcost() and i.hcost < current_node.hcost):
-                    current_node = i
+        start_node.set_hcost(start_node.distance(target_node))
+        start_node.set_parent(None)
+        gcost[start] = 0
+        parent[start] = -1
+        open_heap = IndexedHeap()
+        open_heap.push(start, (start_node.hcost, start_node.hcost, 0))
+        stamp[start] = opened
+        counter = 1
+        expanded = 0
+        pushes = 1
+        reopened = 0
+        evaluated = 0
+        instrumented = self.instrumented
+        trace = self.trace
+
+        while len(open_heap) > 0:
+            current = open_heap.pop()
+            stamp[current] = closed
+            expanded += 1
+            if instrumented and trace is not None:
+                trace(current % width, current // width)
+
+            if current == target:
+                self.expanded = expanded
+                if instrumented:
+                    self._count(expanded, pushes, reopened, evaluated)
+                return True
+            if stop is not None and expanded % STOP_INTERVAL == 0 and stop():
+                break
+            cx = current % width
+            cy = current // width
+            g = gcost[current]
+            here = costs[current]
+            for offset, dx, dy, step in moves[masks[current]]:
+                index = current + offset
+                if stamp[index] == closed:
+                    continue
+                evaluated += 1
+                moving_fee = g + (step >> 1) * (here + costs[index])
+                if stamp[index] != opened:
+                    stamp[index] = opened
+                elif moving_fee >= gcost[index]:
+                    continue
+                gcost[index] = moving_fee
+                parent[index] = current
+                ax = abs(cx + dx - tx)
+                ay = abs(cy + dy - ty)
+                h = 10 * (ax + ay) - 6 * (ax if ax < ay else ay)
+                if index in open_heap:
+                    open_heap.decrease_key(index, (moving_fee + h, h, counter))
+                    reopened += 1
                 else:
-                    pass
-            closed_list.append(current_node)
-            open_list.remove(current_node)
+                    open_heap.push(index, (moving_fee + h, h, counter))
+                    pushes += 1
+                counter += 1
+        self.expanded = expanded
+        if instrumented:
+            self._count(expanded, pushes, reopened, evaluated)
+        return False
 
-            if current_node == target_node:
-                treasure = True
-                target_node.parent = current_node.parent
+    def _walkable(self, x, y):
+        """
+        Return True if x, y is inside the grid and navigable
+
+        @type self: Grid
+        @type x: int
+        @type y: int
+        @rtype: bool
+        """
+        return 0 <= x < self.width and 0 <= y < self.height \
+            and self.nav[y * self.width + x] == 1
+
+    def _jump(self, x, y, dx, dy, tx, ty):
+        """
+        Step from x, y in direction dx, dy and return the first jump
+        point on the way, or None if the way is blocked first.
+        A jump point is the target, a node with a forced neighbour, or,
+        for a diagonal direction, a node from which a straight jump
+        finds a jump point.
+
+        @type self: Grid
+        @type x: int
+        @type y: int
+        @type dx: int
+        @type dy: int
+        @type tx: int
+        @type ty: int
+        @rtype: (int, int) | None
+        """
+        walkable = self._walkable
+        while True:
+            x += dx
+            y += dy
+            if not walkable(x, y):
+                return None
+            if x == tx and y == ty:
+                return x, y
+            if dx != 0 and dy != 0:
+                if (walkable(x - dx, y + dy) and not walkable(x - dx, y)) or \
+                        (walkable(x + dx, y - dy) and not walkable(x, y - dy)):
+                    return x, y
+                if self._jump(x, y, dx, 0, tx, ty) is not None or \
+                        self._jump(x, y, 0, dy, tx, ty) is not None:
+                    return x, y
+            elif dx != 0:
+                if (walkable(x + dx, y + 1) and not walkable(x, y + 1)) or \
+                        (walkable(x + dx, y - 1) and not walkable(x, y - 1)):
+                    return x, y
             else:
-                for neighbour in self.neighbourhood(current_node):
-                    if (neighbour.navigable is False) or (neighbour in closed_list):
-                        pass
-                    else:
-                        moving_fee = current_node.gcost + current_node.distance(neighbour)
-                        if moving_fee < neighbour.gcost or neighbour in closed_list:
-                            neighbour.gcost = moving_fee
-                            neighbour.hcost = current_node.distance(neighbour)
-                            neighbour.parent = current_node
-                            if neighbour not in open_list:
-                                open_list.append(neighbour)
-                            else:
-                                pass
-                        else:
-                            pass
+                if (walkable(x + 1, y + dy) and not walkable(x + 1, y)) or \
+                        (walkable(x - 1, y + dy) and not walkable(x - 1, y)):
+                    return x, y
+
+    def _jump_directions(self, x, y, parent):
+        """
+        Return the directions worth jumping in from x, y when it was
+        reached from the node with index parent, pruning the neighbours
+        that a path through the parent reaches just as cheaply
+
+        @type self: Grid
+        @type x: int
+        @type y: int
+        @type parent: int
+        @rtype: list[(int, int)]
+        """
+        walkable = self._walkable
+        if parent == -1:
+            return [(dx, dy) for dx, dy, step in STEPS]
+        px = parent % self.width
+        py = parent // self.width
+        dx = (x > px) - (x < px)
+        dy = (y > py) - (y < py)
+        directions = []
+        if dx != 0 and dy != 0:
+            directions += [(0, dy), (dx, 0), (dx, dy)]
+            if not walkable(x - dx, y):
+                directions.append((-dx, dy))
+            if not walkable(x, y - dy):
+                directions.append((dx, -dy))
+        elif dx != 0:
+            directions.append((dx, 0))
+            if not walkable(x, y + 1):
+                directions.append((dx, 1))
+            if not walkable(x, y - 1):
+                directions.append((dx, -1))
+        else:
+            directions.append((0, dy))
+            if not walkable(x + 1, y):
+                directions.append((1, dy))
+            if not walkable(x - 1, y):
+                directions.append((-1, dy))
+        return directions
+
+    def _jump_point_search(self, start_node, target_node, stop=None):
+        """
+        Run Jump Point Search from start_node to target_node. The parent
+        of each jump point on the path is the jump point before it, see
+        find_path, _route and _corners.
+
+        @type self: Grid
+        @type start_node: Node
+        @type target_node: Node
+        @type stop: (() -> bool) | None
+        @rtype: bool
+        """
+        width = self.width
+        opened, closed = self._new_search()
+        gcost = self._gcost
+        parent = self._parent
+        stamp = self._stamp
+        tx = target_node.grid_x
+        ty = target_node.grid_y
+        start = start_node.grid_y * width + start_node.grid_x
+        target = ty * width + tx
+        start_node.set_gcost(0)
+        start_node.set_hcost(start_node.distance(target_node))
+        start_node.set_parent(None)
+        gcost[start] = 0
+        parent[start] = -1
+        open_heap = IndexedHeap()
+        open_heap.push(start, (start_node.hcost, start_node.hcost, 0))
+        stamp[start] = opened
+        counter = 1
+        expanded = 0
+        pushes = 1
+        reopened = 0
+        evaluated = 0
+        instrumented = self.instrumented
+        trace = self.trace
+
+        while len(open_heap) > 0:
+            current = open_heap.pop()
+            stamp[current] = closed
+            expanded += 1
+            if instrumented and trace is not None:
+                trace(current % width, current // width)
+
+            if current == target:
+                self.expanded = expanded
+                if instrumented:
+                    self._count(expanded, pushes, reopened, evaluated)
+                return True
+            if stop is not None and expanded % STOP_INTERVAL == 0 and stop():
+                break
+            cx = current % width
+            cy = current // width
+            g = gcost[current]
+            for dx, dy in self._jump_directions(cx, cy, parent[current]):
+                jump = self._jump(cx, cy, dx, dy, tx, ty)
+                if jump is None:
+                    continue
+                x, y = jump
+                index = y * width + x
+                if stamp[index] == closed:
+                    continue
+                evaluated += 1
+                ax = abs(x - cx)
+                ay = abs(y - cy)
+                moving_fee = g + 10 * (ax + ay) - 6 * (ax if ax < ay else ay)
+                if stamp[index] != opened:
+                    stamp[index] = opened
+                elif moving_fee >= gcost[index]:
+                    continue
+                gcost[index] = moving_fee
+                parent[index] = current
+                ax = abs(x - tx)
+                ay = abs(y - ty)
+                h = 10 * (ax + ay) - 6 * (ax if ax < ay else ay)
+                if index in open_heap:
+                    open_heap.decrease_key(index, (moving_fee + h, h, counter))
+                    reopened += 1
+                else:
+                    open_heap.push(index, (moving_fee + h, h, counter))
+                    pushes += 1
+                counter += 1
+        self.expanded = expanded
+        if instrumented:
+            self._count(expanded, pushes, reopened, evaluated)
+        return False
+
+    def component(self, node):
+        """
+        Return the label of the body of water node lies in, or 0 if node
+        is on an island. Two nodes have the same label if and only if
+        there is a path between them that may cut corners. The labels
+        are computed on the first call and kept up to date by
+        set_navigable. They ignore corner_cutting, so while it is False
+        two nodes with the same label may still have no path between
+        them, and find_path then has to search to find that out.
+
+        @type self: Grid
+        @type node: Node
+        @rtype: int
+
+        >>> g = Grid("", ["B.+.", "+++.", "..+T"])
+        >>> g.component(g.boat) == g.component(g.treasure)
+        False
+        >>> g.component(g.node(2, 0))
+        0
+        """
+        if self._labels is None:
+            self._label_components()
+        return self._labels[node.grid_y * self.width + node.grid_x]
+
+    def _label_components(self):
+        """
+        Label every body of water. Each row is split into runs of
+        navigable nodes, runs that touch a run in the row above are
+        joined with union-find, and each run is then labelled with one
+        slice assignment.
+
+        @type self: Grid
+        @rtype: None
+        """
+        width = self.width
+        nav = self.nav
+        runs = []
+        owner = []
+
+        def find(run):
+            while owner[run] != run:
+                owner[run] = owner[owner[run]]
+                run = owner[run]
+            return run
+
+        above = []
+        for y in range(self.height):
+            row = []
+            i = 0
+            for match in RUN_PATTERN.finditer(nav, y * width, (y + 1) * width):
+                start = match.start() - y * width
+                end = match.end() - y * width
+                run = len(runs)
+                runs.append((y, start, end))
+                owner.append(run)
+                while i < len(above) and runs[above[i]][2] < start:
+                    i += 1
+                j = i
+                while j < len(above) and runs[above[j]][1] <= end:
+                    root = find(above[j])
+                    if root != find(run):
+                        owner[root] = find(run)
+                    j += 1
+                row.append(run)
+            above = row
+
+        self._labels = array("i", [0]) * (width * self.height)
+        self._sizes = {}
+        label_of = {}
+        for run, (y, start, end) in enumerate(runs):
+            root = find(run)
+            if root not in label_of:
+                label_of[root] = self._next_label
+                self._sizes[self._next_label] = 0
+                self._next_label += 1
+            label = label_of[root]
+            self._labels[y * width + start:y * width + end] = \
+                array("i", [label]) * (end - start)
+            self._sizes[label] += end - start
+
+    def _flood(self, seed, old, new):
+        """
+        Relabel as new every navigable node labelled old that is
+        connected to the node with index seed, and return how many
+        nodes were relabelled
+
+        @type self: Grid
+        @type seed: int
+        @type old: int
+        @type new: int
+        @rtype: int
+        """
+        width = self.width
+        height = self.height
+        nav = self.nav
+        labels = self._labels
+        labels[seed] = new
+        stack = [seed]
+        count = 0
+        while stack:
+            current = stack.pop()
+            count += 1
+            cx = current % width
+            cy = current // width
+            for dx, dy, step in STEPS:
+                x = cx + dx
+                y = cy + dy
+                if 0 <= x < width and 0 <= y < height:
+                    index = y * width + x
+                    if labels[index] == old and nav[index] == 1:
+                        labels[index] = new
+                        stack.append(index)
+        return count
+
+    def set_navigable(self, grid_x, grid_y, navigable):
+        """
+        Turn the node with coordinates grid_x, grid_y into sea if
+        navigable is True, or into an island otherwise, updating the
+        text map and the body of water labels. The text map is written
+        with characters the legend maps to an island and to sea costing
+        1, so it still parses back to the same grid; if the legend has
+        no such character, ValueError is raised.
+
+        @type self: Grid
+        @type grid_x: int
+        @type grid_y: int
+        @type navigable: bool
+        @rtype: None
+
+        >>> g = Grid("", ["B.+.", "+++.", "..+T"])
+        >>> g.set_navigable(2, 1, True)
+        >>> g.find_path(g.boat, g.treasure)
+        True
+        >>> g.set_navigable(2, 1, False)
+        >>> g.find_path(g.boat, g.treasure)
+        False
+        >>> g = Grid("", ["B+.#", "...T"], {"+": 2, "#": None})
+        >>> g.set_navigable(2, 0, False)
+        >>> g.set_navigable(3, 0, True)
+        >>> print(g)
+        B+#.
+        ...T
+        >>> h = Grid("", str(g).splitlines(), {"+": 2, "#": None})
+        >>> h.nav == g.nav and h.costs == g.costs
+        True
+        """
+        with self._lock:
+            self._set_navigable(grid_x, grid_y, navigable)
+
+    def _set_navigable(self, grid_x, grid_y, navigable):
+        """
+        Change the node with coordinates grid_x, grid_y as set_navigable
+        does, while holding _lock
+
+        @type self: Grid
+        @type grid_x: int
+        @type grid_y: int
+        @type navigable: bool
+        @rtype: None
+        """
+        index = grid_y * self.width + grid_x
+        if not navigable and ((grid_x, grid_y) == (self.boat.grid_x,
+                                                   self.boat.grid_y) or
+                              (grid_x, grid_y) == (self.treasure.grid_x,
+                                                   self.treasure.grid_y)):
+            raise ValueError("the boat and treasure must stay on the sea")
+        if self.nav[index] == int(navigable):
+            return
+        mark = self._sea if navigable else self._island
+        if mark is None:
+            raise ValueError("the legend has no character for {}".format(
+                "sea costing 1" if navigable else "an island"))
+        self.nav[index] = int(navigable)
+        self.costs[index] = 1
+        self.version += 1
+        self.map_version += 1
+        self._linked = {}
+        if self._masks is not None:
+            for y in range(max(0, grid_y - 1), min(self.height, grid_y + 2)):
+                for x in range(max(0, grid_x - 1),
+                               min(self.width, grid_x + 2)):
+                    self._masks[y * self.width + x] = self._cell_mask(x, y)
+        if self.planner is not None:
+            self.planner.update_cell(grid_x, grid_y)
+        self._canvas[self._offset(grid_x, grid_y)] = mark
+        if self._labels is None:
+            return
+
+        labels = self._labels
+        sizes = self._sizes
+        around = []
+        for dx, dy, step in STEPS:
+            x = grid_x + dx
+            y = grid_y + dy
+            if 0 <= x < self.width and 0 <= y < self.height and \
+                    self.nav[y * self.width + x] == 1:
+                around.append((dx, dy))
+        if navigable:
+            # join the cell to the largest neighbouring body of water,
+            # and relabel the others into it
+            found = {labels[(grid_y + dy) * self.width + grid_x + dx]
+                     for dx, dy in around}
+            if not found:
+                labels[index] = self._next_label
+                sizes[self._next_label] = 1
+                self._next_label += 1
+                return
+            largest = max(found, key=lambda label: sizes[label])
+            labels[index] = largest
+            sizes[largest] += 1
+            for dx, dy in around:
+                seed = (grid_y + dy) * self.width + grid_x + dx
+                old = labels[seed]
+                if old != largest:
+                    sizes[largest] += self._flood(seed, old, largest)
+                    del sizes[old]
+        else:
+            # the body of water can only split if the remaining
+            # neighbours of the cell are not connected around it
+            old = labels[index]
+            labels[index] = 0
+            sizes[old] -= 1
+            groups = []
+            for dx, dy in around:
+                joined = [(dx, dy)]
+                for group in groups[:]:
+                    if any(max(abs(dx - gx), abs(dy - gy)) == 1
+                           for gx, gy in group):
+                        joined += group
+                        groups.remove(group)
+                groups.append(joined)
+            if not groups:
+                del sizes[old]
+            for group in groups[1:]:
+                dx, dy = group[0]
+                seed = (grid_y + dy) * self.width + grid_x + dx
+                if labels[seed] == old:
+                    count = self._flood(seed, old, self._next_label)
+                    sizes[self._next_label] = count
+                    sizes[old] -= count
+                    self._next_label += 1
+
+    def _cached_path(self, key):
+        """
+        Return the turning points of the path cached under key, see
+        _corners, or None if there is no such path or it has expired
+
+        @type self: Grid
+        @type key: (int, int, int)
+        @rtype: array[int] | None
+        """
+        stats = self.path_cache_stats
+        entry = self._paths.get(key)
+        if entry is not None and self.path_cache_ttl is not None and \
+                time.monotonic() - entry[0] > self.path_cache_ttl:
+            del self._paths[key]
+            stats["evictions"] += 1
+            entry = None
+        if entry is None:
+            stats["misses"] += 1
+            return None
+        stats["hits"] += 1
+        self._paths.move_to_end(key)
+        return entry[1]
+
+    def _cache_path(self, key, corners):
+        """
+        Cache the path with turning points corners under key, evicting
+        the least recently used paths beyond path_cache_size
+
+        @type self: Grid
+        @type key: (int, int, int)
+        @type corners: array[int]
+        @rtype: None
+        """
+        if self.path_cache_size <= 0:
+            return
+        self._paths[key] = (time.monotonic(), corners)
+        self._paths.move_to_end(key)
+        while len(self._paths) > self.path_cache_size:
+            self._paths.popitem(last=False)
+            self.path_cache_stats["evictions"] += 1
+
+    def _link_indices(self, start_node, target_node, indices):
+        """
+        Link Nodes for the path given by indices, the node indices
+        from the one after start_node up to target_node, through their
+        parents, as find_path does, and keep them for node to return
+
+        @type self: Grid
+        @type start_node: Node
+        @type target_node: Node
+        @type indices: Iterable[int]
+        @rtype: list[Node]
+        """
+        width = self.width
+        costs = self.costs
+        target = target_node.grid_y * width + target_node.grid_x
+        path = []
+        parent = start_node
+        before = start_node.grid_y * width + start_node.grid_x
+        gcost = 0
+        for index in indices:
+            if index == target:
+                node = target_node
+            else:
+                node = Node(True, index % width, index // width)
+            gcost += parent.distance(node) // 2 * (costs[before] +
+                                                   costs[index])
+            before = index
+            node.set_gcost(gcost)
+            node.set_hcost(node.distance(target_node))
+            node.set_parent(parent)
+            path.append(node)
+            parent = node
+        self._linked = {(node.grid_x, node.grid_y): node
+                        for node in [start_node] + path}
+        return path
+
+    def _new_search(self):
+        """
+        Start a new search and return the stamps (opened, closed) that
+        mark a node as open or closed in it. Any other stamp means the
+        node is not reached yet, and its gcost and parent are stale.
+
+        The state arrays are made on the first search, and only reset
+        when the stamps run out.
+
+        @type self: Grid
+        @rtype: (int, int)
+        """
+        size = self.width * self.height
+        if self._stamp is None:
+            self._gcost = array("i", [0]) * size
+            self._parent = array("i", [-1]) * size
+            self._stamp = array("I", [0]) * size
+        self._generation += 1
+        if 2 * self._generation + 1 > MAX_STAMP:
+            self._stamp = array("I", [0]) * size
+            self._generation = 1
+        return 2 * self._generation, 2 * self._generation + 1
+
+    def distance_map(self, source_node, targets=None):
+        """
+        Return the DistanceField from source_node, with every node in
+        targets settled, or every reachable node if targets is None.
+        The last field_cache_size fields are kept, and one is reused as
+        long as the map has not changed since it was computed, however
+        the boat has moved.
+
+        @type self: Grid
+        @type source_node: Node
+        @type targets: list[Node] | None
+        @rtype: DistanceField
+        """
+        source = source_node.grid_y * self.width + source_node.grid_x
+        with self._lock:
+            field = self._fields.get(source)
+            if field is None or field.version != self.map_version:
+                field = DistanceField(self, source)
+                self._fields[source] = field
+            self._fields.move_to_end(source)
+            while len(self._fields) > self.field_cache_size:
+                self._fields.popitem(last=False)
+            if targets is None:
+                field.settle(None)
+            else:
+                field.settle([node.grid_y * self.width + node.grid_x
+                              for node in targets])
+        return field
+
+    def nearest(self, source_node, targets):
+        """
+        Return the node in targets with the shortest path from
+        source_node, and the cost of that path, or None if none of them
+        can be reached. Targets in other bodies of water are dropped
+        first, see component, and the search stops at the first target
+        it settles.
+
+        @type self: Grid
+        @type source_node: Node
+        @type targets: list[Node]
+        @rtype: (Node, int) | None
+
+        >>> g = Grid("", ["B.++", ".+..", "...T"])
+        >>> node, cost = g.nearest(g.boat, [g.treasure, g.node(2, 2)])
+        >>> print(node, cost)
+        True 2 2 34
+        >>> print(g.nearest(g.boat, [g.node(3, 0)]))
+        None
+        """
+        label = self.component(source_node)
+        by_index = {node.grid_y * self.width + node.grid_x: node
+                    for node in targets if self.component(node) == label}
+        if not by_index:
+            return None
+        field = self.distance_map(source_node, [])
+        index = field.settle(list(by_index), False)
+        if index == -1:
+            return None
+        return by_index[index], field.dist[index]
+
+    def _cached_field(self, start_node, target_node):
+        """
+        Return a cached, current DistanceField from start_node in which
+        target_node is already settled, or None if there is none
+
+        @type self: Grid
+        @type start_node: Node
+        @type target_node: Node
+        @rtype: DistanceField | None
+        """
+        field = self._fields.get(start_node.grid_y * self.width +
+                                 start_node.grid_x)
+        if field is None or field.version != self.map_version or \
+                field.dist[target_node.grid_y * self.width +
+                           target_node.grid_x] == -1:
+            return None
+        return field
+
+    def find_paths(self, pairs, workers=None):
+        """
+        Return the paths between many pairs of nodes, in the order of
+        pairs, each one a list of Nodes as returned by retrace_path.
+
+        With workers set to more than 1, the searches are shared out
+        over a pool of that many processes. The navigability buffer,
+        cost plane, neighbour masks and body of water labels are put in
+        shared memory, so the workers search the same map without a
+        copy each. The pool is kept for later calls with as many
+        workers until the map changes, see close_workers, so only the
+        first call pays for starting it.
+
+        @type self: Grid
+        @type pairs: list[(Node, Node)]
+        @type workers: int | None
+        @rtype: list[list[Node]]
+
+        >>> g = Grid("", ["B.++", ".+..", "...T"])
+        >>> paths = g.find_paths([(g.boat, g.treasure), (g.treasure, g.boat)])
+        >>> [[str(n) for n in path] for path in paths]
+        [['True 1 0', 'True 2 1', 'True 3 2'], \
+['True 2 1', 'True 1 0', 'True 0 0']]
+        """
+        if workers is None or workers <= 1:
+            paths = []
+            for start_node, target_node in pairs:
+                self.find_path(start_node, target_node)
+                paths.append(self.retrace_path(start_node, target_node))
+            return paths
+
+        pool = self._worker_pool(workers)
+        jobs = [(start.grid_x, start.grid_y, target.grid_x, target.grid_y)
+                for start, target in pairs]
+        found = pool.map(_find_in_worker, jobs,
+                         chunksize=max(1, len(jobs) // (4 * workers)))
+        return [self._link_indices(start_node, target_node,
+                                   self._expand(corners))
+                for (start_node, target_node), corners in zip(pairs, found)]
+
+    def _worker_pool(self, workers):
+        """
+        Return the pool of worker processes searching the map as it is
+        now for find_paths, starting it, and stopping the one before,
+        if there is none yet or the map has changed since
+
+        @type self: Grid
+        @type workers: int
+        @rtype: multiprocessing.pool.Pool
+        """
+        key = (workers, self.map_version)
+        if self._pool is not None and self._pool[0] == key:
+            return self._pool[1]
+        self.close_workers()
+        self.component(self.boat)
+        size = self.width * self.height
+        memory = shared_memory.SharedMemory(create=True, size=7 * size)
+        try:
+            memory.buf[:size] = self.nav
+            memory.buf[size:2 * size] = self.costs
+            memory.buf[2 * size:3 * size] = self.neighbour_masks()
+            memory.buf[3 * size:] = self._labels.tobytes()
+            pool = multiprocessing.Pool(
+                workers, _start_worker,
+                (memory.name, self.width, self.height, self.weighted,
+                 self.corner_cutting))
+        except BaseException:
+            memory.close()
+            memory.unlink()
+            raise
+        self._pool = (key, pool, weakref.finalize(self, _stop_pool, pool,
+                                                  memory))
+        return pool
+
+    def close_workers(self):
+        """
+        Stop the worker processes find_paths keeps, if any, and free the
+        shared memory they search. This also happens when the grid is
+        garbage collected, or when the interpreter exits.
+
+        @type self: Grid
+        @rtype: None
+
+        >>> g = Grid("", ["B.++", ".+..", "...T"])
+        >>> for i in range(2):
+        ...     paths = g.find_paths([(g.boat, g.treasure)] * 4, 2)
+        >>> [str(n) for n in paths[3]]
+        ['True 1 0', 'True 2 1', 'True 3 2']
+        >>> g.close_workers()
+        """
+        if self._pool is not None:
+            self._pool[2]()
+            self._pool = None
+
+    async def find_path_async(self, start_node, target_node,
+                              algorithm="astar", timeout=None):
+        """
+        Return the shortest path from start_node to target_node as a
+        list of Nodes, as retrace_path does after find_path, without
+        blocking the event loop, or an empty list if there is no path.
+
+        The search runs on a thread of its own, one search at a time,
+        since they share the search state of this grid. A request for
+        the same path on the same map as a search still running waits
+        for that search instead of queueing another. If timeout
+        seconds pass first, asyncio.TimeoutError is raised. When every
+        request waiting for a search has timed out or been cancelled,
+        the search itself stops at its next check, see _route.
+
+        The map should only be changed from the thread running the
+        event loop. A change waits for the search running, if any, to
+        finish, as do searches from find_path, see _route.
+
+        @type self: Grid
+        @type start_node: Node
+        @type target_node: Node
+        @type algorithm: str
+        @type timeout: float | None
+        @rtype: list[Node]
+
+        >>> g = Grid("", ["B.++", ".+..", "...T"])
+        >>> async def ask_twice():
+        ...     return await asyncio.gather(
+        ...         g.find_path_async(g.boat, g.treasure),
+        ...         g.find_path_async(g.boat, g.treasure))
+        >>> paths = asyncio.run(ask_twice())
+        >>> [[str(n) for n in path] for path in paths]
+        [['True 1 0', 'True 2 1', 'True 3 2'], \
+['True 1 0', 'True 2 1', 'True 3 2']]
+        >>> g.path_cache_stats
+        {'hits': 0, 'misses': 1, 'evictions': 0}
+
+        A search from find_path meanwhile takes its turn:
+
+        >>> async def ask_both():
+        ...     pending = g.find_path_async(g.map[0][1], g.treasure)
+        ...     found = g.find_path(g.boat, g.map[3][1])
+        ...     return found, await pending
+        >>> found, path = asyncio.run(ask_both())
+        >>> found, [str(n) for n in path]
+        (True, ['True 1 2', 'True 2 2', 'True 3 2'])
+        >>> g.retrace_path(g.map[0][1], g.treasure) == path
+        True
+        """
+        if algorithm not in ["astar", "jps"]:
+            raise ValueError("unknown algorithm: {}".format(algorithm))
+        width = self.width
+        start = start_node.grid_y * width + start_node.grid_x
+        target = target_node.grid_y * width + target_node.grid_x
+        key = (start, target, algorithm, self.map_version)
+        search = self._searches.get(key)
+        if search is None:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1)
+            stopped = threading.Event()
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._route,
+                Node(True, start % width, start // width),
+                Node(True, target % width, target // width),
+                algorithm, stopped.is_set)
+            search = [future, stopped, 0]
+            self._searches[key] = search
+            future.add_done_callback(
+                lambda done: self._end_search(key, search))
+        search[2] += 1
+        try:
+            corners = await asyncio.wait_for(asyncio.shield(search[0]),
+                                             timeout)
+        finally:
+            search[2] -= 1
+            if search[2] == 0 and not search[0].done():
+                search[1].set()
+                self._end_search(key, search)
+        if corners is None:
+            target_node.set_parent(None)
+            return []
+        start_node.set_gcost(0)
+        start_node.set_hcost(start_node.distance(target_node))
+        start_node.set_parent(None)
+        return self._link_indices(start_node, target_node,
+                                  self._expand(corners))
+
+    def _end_search(self, key, search):
+        """
+        Forget search, the running search for the path under key, so
+        later requests for that path start a search of their own
+
+        @type self: Grid
+        @type key: (int, int, str, int)
+        @type search: list
+        @rtype: None
+        """
+        if self._searches.get(key) is search:
+            del self._searches[key]
 
     def retrace_path(self, start_node, target_node):
         """
@@ -470,23 +2639,56 @@ class Grid:
         @type target_node: Node
         @rtype: list[Node]
         """
+        if self.instrumented:
+            begin = time.perf_counter()
         empty_path = []
         current_node = target_node
 
         while current_node != start_node:
+            if current_node is None:
+                empty_path = []
+                break
             empty_path.append(current_node)
             current_node = current_node.parent
         empty_path.reverse()
+        if self.instrumented:
+            self.timers["retrace"] += time.perf_counter() - begin
         return empty_path
 
-    def get_treasure(self, s_range):
+    def get_treasure(self, s_range, by_path=False):
         """
         Return treasure node if it is located at a distance s_range or
         less from the boat, else return None
+        If by_path is True, the distance is the cost of the shortest
+        path from the boat, instead of the straight-line distance. It
+        is taken from the cached distance field of the treasure, since
+        paths cost the same both ways, so the field outlives moves of
+        the boat. No path is shorter than the straight line, so the
+        field is only searched if that is in range and the boat and
+        treasure lie in the same body of water, see component, and then
+        only until the boat is settled.
         @type s_range: int
+        @type by_path: bool
         @rtype: Node, None
+
+        >>> g = Grid("", ["B.+T", ".++.", "...."])
+        >>> print(g.get_treasure(40))
+        True 3 0
+        >>> print(g.get_treasure(40, True))
+        None
+        >>> g = Grid("", ["B+T", "++."])
+        >>> print(g.get_treasure(100), g.get_treasure(100, True))
+        True 2 0 None
         """
-        if self.boat.distance(self.treasure) < s_range:
+        if by_path and self.component(self.boat) != \
+                self.component(self.treasure):
+            distance = None
+        elif by_path and self.boat.distance(self.treasure) < s_range:
+            distance = self.distance_map(
+                self.treasure, [self.boat]).distance(self.boat)
+        else:
+            distance = self.boat.distance(self.treasure)
+        if distance is not None and distance < s_range:
             return self.treasure
         else:
             return None
@@ -496,6 +2698,9 @@ class Grid:
         Return a string representation of the grid map,
         plotting the shortest path from start_node to target_node
         computed by find_path using "*" characters to show the path
+        If there is no path, the map is returned unchanged
+        If a planner is attached for the same start and target, the
+        path is taken from it instead of a fresh search
         @type self: Grid
         @type start_node: Node
         @type target_node: Node["B.++", ".+..", "...T"]
@@ -506,23 +2711,189 @@ class Grid:
         .+*.
         ...T
         """
-        self.find_path(self.boat, self.treasure)
-        traced_path = self.retrace_path(self.boat, self.treasure)
-        traced_path.pop()
-        for i in traced_path:
-            x = i.grid_x
-            y = i.grid_y
-            a = self.boat.grid_x
-            b = self.boat.grid_y
-            a_ = a + x
-            b_ = b + y
-            other_row = self.text_grid[b_]
-            other_row = list(other_row)
-            other_row[a_] = "*"
-            new_other_row = "".join(other_row)
-            self.text_grid[b_] = new_other_row
+        if self.planner is not None and self.planner.plans(start_node,
+                                                           target_node):
+            for i in self.planner.path()[:-1]:
+                self._canvas[self._offset(i.grid_x, i.grid_y)] = ord("*")
+            return self
+        corners = self._route(start_node, target_node)
+        if corners is not None:
+            width = self.width
+            for index in self._expand(corners):
+                if index != corners[-1]:
+                    self._canvas[index + index // width] = ord("*")
         return self
 
+
+def _pack_bits(plane):
+    """
+    Return plane, a navigability buffer, packed eight nodes to a byte,
+    first node in the highest bit, padded with zeros to whole bytes.
+    Every eighth node from the k-th on makes up bit k of the bytes, so
+    each of the eight is translated and merged as a whole.
+
+    @type plane: bytes
+    @rtype: bytes
+
+    >>> _pack_bits(bytes([1, 0, 0, 0, 0, 0, 0, 1, 1]))
+    b'\\x81\\x80'
+    """
+    plane = bytes(plane) + bytes(-len(plane) % 8)
+    bits = 0
+    for k, table in enumerate(PACK_TABLES):
+        bits |= int.from_bytes(plane[k::8].translate(table), "big")
+    return bits.to_bytes(len(plane) // 8, "big")
+
+
+def _unpack_bits(data, size):
+    """
+    Return the first size nodes of data, packed by _pack_bits, as a
+    navigability buffer. With NumPy the bits are unpacked in one call,
+    else every eighth node is filled at once.
+
+    @type data: bytes | memoryview
+    @type size: int
+    @rtype: bytearray
+
+    >>> list(_unpack_bits(b"\\x81\\x80", 9))
+    [1, 0, 0, 0, 0, 0, 0, 1, 1]
+    """
+    if numpy is not None:
+        return bytearray(numpy.unpackbits(
+            numpy.frombuffer(data, dtype=numpy.uint8), count=size))
+    data = bytes(data)
+    plane = bytearray(len(data) * 8)
+    for k, table in enumerate(UNPACK_TABLES):
+        plane[k::8] = data.translate(table)
+    del plane[size:]
+    return plane
+
+
+def _legend_tables(legend):
+    """
+    Return the tables translating map characters to navigability and
+    to cost by legend merged over LEGEND, see Grid.__init__. The cost
+    table is None if every sea character costs 1.
+
+    @type legend: dict[str, int | None] | None
+    @rtype: (bytes, bytes | None)
+
+    >>> nav_table, cost_table = _legend_tables({"~": 3})
+    >>> nav_table[ord("+")], cost_table[ord("~")]
+    (0, 3)
+    """
+    legend = dict(LEGEND, **(legend or {}))
+    nav_table = bytearray(b"\x01") * 256
+    cost_table = bytearray(b"\x01") * 256
+    for char, cost in legend.items():
+        if cost is not None and not 1 <= cost <= MAX_COST:
+            raise ValueError("cost of {!r} must be from 1 to {}".format(
+                char, MAX_COST))
+        if cost is None and char in "BT":
+            raise ValueError("the boat and treasure must be on the sea")
+        nav_table[ord(char)] = 0 if cost is None else 1
+        cost_table[ord(char)] = 1 if cost is None else cost
+    if cost_table.count(1) == 256:
+        return bytes(nav_table), None
+    return bytes(nav_table), bytes(cost_table)
+
+
+def _legend_marks(nav_table, cost_table):
+    """
+    Return the map characters that the tables from _legend_tables turn
+    into an island and into sea costing 1, "+" and "." where they can,
+    or None where no printable character other than B and T will do
+
+    @type nav_table: bytes
+    @type cost_table: bytes | None
+    @rtype: (int | None, int | None)
+
+    >>> [chr(c) for c in _legend_marks(*_legend_tables({"+": 2, "#": None}))]
+    ['#', '.']
+    """
+    chars = b"+." + bytes(c for c in range(33, 127) if c not in b"+.BT")
+    island = next((c for c in chars if nav_table[c] == 0), None)
+    sea = next((c for c in chars if nav_table[c] == 1 and
+                (cost_table is None or cost_table[c] == 1)), None)
+    return island, sea
+
+
+# the grid each worker process of Grid.find_paths searches
+_worker_grid = None
+
+
+def _start_worker(name, width, height, weighted, corner_cutting):
+    """
+    Set up a worker process of Grid.find_paths on the map in the shared
+    memory block called name, letting it go when the worker exits
+
+    @type name: str
+    @type width: int
+    @type height: int
+    @type weighted: bool
+    @type corner_cutting: bool
+    @rtype: None
+    """
+    global _worker_grid
+    memory = shared_memory.SharedMemory(name)
+    size = width * height
+    grid = Grid.__new__(Grid)
+    grid._setup(width, height, memory.buf[:size], memory.buf[size:2 * size])
+    grid.weighted = weighted
+    grid.corner_cutting = corner_cutting
+    grid._masks = memory.buf[2 * size:3 * size]
+    grid._labels = memory.buf[3 * size:].cast("i")
+    grid._memory = memory
+    _worker_grid = grid
+    multiprocessing.util.Finalize(None, _stop_worker, exitpriority=10)
+
+
+def _stop_worker():
+    """
+    Release the views of the worker grid on its shared memory block and
+    close it, as a worker process of Grid.find_paths exits
+
+    @rtype: None
+    """
+    global _worker_grid
+    grid = _worker_grid
+    _worker_grid = None
+    for view in [grid.nav, grid.costs, grid._masks, grid._labels]:
+        view.release()
+    grid._memory.close()
+
+
+def _stop_pool(pool, memory):
+    """
+    Stop the worker processes of pool, letting each close its handle on
+    the shared memory block memory, then free the block
+
+    @type pool: multiprocessing.pool.Pool
+    @type memory: SharedMemory
+    @rtype: None
+    """
+    pool.close()
+    pool.join()
+    memory.close()
+    memory.unlink()
+
+
+def _find_in_worker(job):
+    """
+    Search the worker grid for the path given by job, the coordinates
+    start x, start y, target x, target y, and return the indices of its
+    turning points, see Grid._corners, or none if there is no path
+
+    @type job: (int, int, int, int)
+    @rtype: array[int]
+    """
+    corners = _worker_grid._route(Node(True, job[0], job[1]),
+                                  Node(True, job[2], job[3]))
+    if corners is None:
+        return array("i")
+    return corners
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -0,0 +1,694 @@
+"""Hierarchical pathfinding
+
+An HPA* layer over a Grid for very large maps. The map is cut into
+square sectors. Where two neighbouring sectors share a run of open
+border, an entrance is placed: one transition in the middle of the run,
+or one at each end when the run is long. Inside each sector, the
+shortest path between every pair of transitions is found with the step
+costs of Node.distance, by one search from each transition, and its
+cost and steps are kept. A sector is only worked out the first time a
+query reaches it, or by precompute, so making the abstraction is quick
+and the work is spread over the queries that need it. A query searches
+this small abstract graph, linking the start and target to the
+transitions of their sectors by one search each unless they are
+transitions themselves, and turns the route back into nodes from the
+steps kept for it, without searching the grid again.
+
+Paths found this way are not always shortest: a route has to cross
+each border at a transition, so it may bend away from the straight
+line by up to half a sector at every crossing. There is no bound on
+the detour that holds on every map. With the default sectors of 32,
+on 500 by 500 and 1000 by 1000 maps with a quarter of islands, plain
+and weighted, paths came out 2 percent longer than the A-star path on
+average, and at most 8 percent longer over 180 queries. Small sectors
+do worse: with sectors of 2 to 8 on small random maps, some paths came
+out more than twice as long. Queries between the same or touching
+sectors, where the detour would matter most, are answered by a search
+of the grid itself, as are queries the abstract graph has no route
+for, so a path is always found when one exists.
+
+On those maps a query through sectors already worked out takes about
+a fifth of the time of a search of the grid, or a tenth on weighted
+maps. Working out a sector of 32 takes about 50 ms, so a query
+reaching many new sectors is slower than a search of the grid, and
+precompute takes about 12 s on a 500 by 500 map.
+
+The abstraction records the map_version of its grid, and is rebuilt
+by the first query after the map changes.
+"""
+
+import heapq
+import json
+
+from grid import Node, STEPS
+
+# cost of a node a search has not reached
+UNREACHED = 1 << 62
+
+# entrances longer than this get a transition at each end
+LONG_ENTRANCE = 6
+
+# version of the saved abstraction format
+FORMAT_VERSION = 2
+
+# the bit of the neighbour mask of a node for each step dx, dy
+BITS = {(dx, dy): k for k, (dx, dy, step) in enumerate(STEPS)}
+
+# translation tables clearing the bits of the steps that leave a sector
+# through the side dx, dy of it
+EDGE_TABLES = {
+    (sx, sy): bytes(mask & sum(1 << k for k, (dx, dy, step)
+                               in enumerate(STEPS)
+                               if not (sx and dx == sx or sy and dy == sy))
+                    for mask in range(256))
+    for sx, sy in [(0, -1), (0, 1), (-1, 0), (1, 0)]}
+
+# translation table turning the index in STEPS of a step into that of
+# the step back
+OPPOSITE = bytes(BITS[(-dx, -dy)] for dx, dy, step in STEPS) + bytes(248)
+
+
+def _reverse(steps):
+    """
+    Return the steps back along steps, as kept in Abstraction.paths
+
+    @type steps: bytes
+    @rtype: bytes
+
+    >>> [STEPS[k][:2] for k in _reverse(bytes([BITS[(1, 0)], BITS[(1, 1)]]))]
+    [(-1, -1), (-1, 0)]
+    """
+    return steps[::-1].translate(OPPOSITE)
+
+
+class Abstraction:
+    """
+    The abstract graph of a Grid.
+
+    === Attributes: ===
+    @type grid: Grid
+       the grid this is an abstraction of
+    @type sector: int
+       the width and height of a sector, in nodes
+    @type edges: dict[int, dict[int, int]]
+       edges[a][b] is the cost of going from transition a to
+       transition b; transitions are node indices y * width + x
+    @type members: dict[int, list[int]]
+       members[s] lists the transitions in the sector with index s
+    @type paths: dict[(int, int), bytes]
+       paths[(a, b)] holds the steps of the shortest path inside their
+       sector from transition a to transition b, as the index in STEPS
+       of each step, one byte each; it is kept one way only, see
+       _reverse
+    @type map_version: int
+       the map_version of grid the abstraction was built on
+    """
+    def __init__(self, grid, sector=32):
+        """
+        Build the abstraction of grid with sectors of the given size.
+        Only the transitions are placed now; the edges and paths inside
+        each sector are worked out the first time a query reaches it,
+        or by precompute.
+
+        @type self: Abstraction
+        @type grid: Grid
+        @type sector: int
+        @rtype: None
+
+        >>> from grid import Grid
+        >>> g = Grid("", ["B...+...", "....+...", "........", "....+..T"])
+        >>> a = Abstraction(g, 2)
+        >>> len(a.members)
+        8
+        """
+        self.grid = grid
+        self.sector = sector
+        self._move_tables = {}
+        self._build()
+
+    def _build(self):
+        """
+        Build the abstract graph from the map of the grid as it is now
+
+        @type self: Abstraction
+        @rtype: None
+        """
+        self.edges = {}
+        self.members = {}
+        self.paths = {}
+        self.map_version = self.grid.map_version
+        self._add_entrances()
+        self._pending = set(self.members)
+
+    def precompute(self):
+        """
+        Work out the edges and paths inside every sector no query has
+        reached yet, as save does before writing, rebuilding the
+        abstraction first if the map changed since it was built
+
+        @type self: Abstraction
+        @rtype: None
+
+        >>> from grid import Grid
+        >>> g = Grid("", ["B...+...", "....+...", "........", "....+..T"])
+        >>> a = Abstraction(g, 2)
+        >>> len(a.paths)
+        0
+        >>> a.precompute()
+        >>> len(a.paths)
+        8
+        """
+        if self.map_version != self.grid.map_version:
+            self._build()
+        for sector in list(self._pending):
+            self._add_intra_edges(sector)
+
+    def _ready(self, index):
+        """
+        Work out the edges and paths inside the sector of the transition
+        with index index, if no query has reached it yet
+
+        @type self: Abstraction
+        @type index: int
+        @rtype: None
+        """
+        sector = self.sector_of(index)
+        if sector in self._pending:
+            self._add_intra_edges(sector)
+
+    def sector_of(self, index):
+        """
+        Return the index of the sector the node with index index is in
+
+        @type self: Abstraction
+        @type index: int
+        @rtype: int
+        """
+        width = self.grid.width
+        columns = -(-width // self.sector)
+        return (index // width // self.sector) * columns + \
+            index % width // self.sector
+
+    def _bounds(self, sector):
+        """
+        Return the bounds x0, y0, x1, y1 of the sector with index sector,
+        the last two exclusive
+
+        @type self: Abstraction
+        @type sector: int
+        @rtype: (int, int, int, int)
+        """
+        columns = -(-self.grid.width // self.sector)
+        x0 = sector % columns * self.sector
+        y0 = sector // columns * self.sector
+        return x0, y0, min(x0 + self.sector, self.grid.width), \
+            min(y0 + self.sector, self.grid.height)
+
+    def _link(self, a, b, cost):
+        """
+        Add an edge both ways between the nodes with indices a and b
+
+        @type self: Abstraction
+        @type a: int
+        @type b: int
+        @type cost: int
+        @rtype: None
+        """
+        for node in [a, b]:
+            if node not in self.edges:
+                self.edges[node] = {}
+                self.members.setdefault(self.sector_of(node), []).append(node)
+        self.edges[a][b] = cost
+        self.edges[b][a] = cost
+
+    def _add_entrances(self):
+        """
+        Place the transitions along every border between two sectors
+
+        @type self: Abstraction
+        @rtype: None
+        """
+        width = self.grid.width
+        height = self.grid.height
+        size = self.sector
+        for x in range(size, width, size):
+            for y0 in range(0, height, size):
+                self._add_border([(y * width + x - 1, y * width + x)
+                                  for y in range(y0, min(y0 + size, height))])
+        for y in range(size, height, size):
+            for x0 in range(0, width, size):
+                self._add_border([((y - 1) * width + x, y * width + x)
+                                  for x in range(x0, min(x0 + size, width))])
+
+    def _add_border(self, pairs):
+        """
+        Place the transitions along one border, given as the list of
+        pairs of nodes facing each other across it
+
+        @type self: Abstraction
+        @type pairs: list[(int, int)]
+        @rtype: None
+        """
+        nav = self.grid.nav
+        costs = self.grid.costs
+        run = []
+        for a, b in pairs + [(None, None)]:
+            if a is not None and nav[a] == 1 and nav[b] == 1:
+                run.append((a, b))
+                continue
+            if len(run) > LONG_ENTRANCE:
+                ends = [run[0], run[-1]]
+            else:
+                ends = run[len(run) // 2:len(run) // 2 + 1]
+            for c, d in ends:
+                self._link(c, d, 5 * (costs[c] + costs[d]))
+            run = []
+        # crossings that are only possible diagonally, between two
+        # islands, so not at all without corner cutting
+        if not self.grid.corner_cutting:
+            return
+        for (a, b), (c, d) in zip(pairs, pairs[1:]):
+            if (nav[a] == 1 and nav[b] == 1) or (nav[c] == 1 and nav[d] == 1):
+                continue
+            if nav[a] == 1 and nav[d] == 1:
+                self._link(a, d, 7 * (costs[a] + costs[d]))
+            if nav[c] == 1 and nav[b] == 1:
+                self._link(c, b, 7 * (costs[c] + costs[b]))
+
+    def _add_intra_edges(self, sector):
+        """
+        Link every pair of transitions in the sector with index sector
+        by the cost of the shortest path between them inside it, and
+        keep the steps of that path in paths. Each search stops once
+        the transitions after its own in members are settled.
+
+        @type self: Abstraction
+        @type sector: int
+        @rtype: None
+        """
+        self._pending.discard(sector)
+        members = self.members[sector]
+        bounds = self._bounds(sector)
+        plane = self._plane(bounds)
+        local = [self._local(node, bounds) for node in members]
+        for i, a in enumerate(members[:-1]):
+            dist, via = self._search(local[i], plane, local[i + 1:])
+            for j in range(i + 1, len(members)):
+                if dist[local[j]] != UNREACHED:
+                    self._link(a, members[j], dist[local[j]])
+                    self.paths[(a, members[j])] = self._steps(
+                        via, local[i], local[j], plane[3])
+
+    def _local(self, index, bounds):
+        """
+        Return the index within bounds of the node with index index
+
+        @type self: Abstraction
+        @type index: int
+        @type bounds: (int, int, int, int)
+        @rtype: int
+        """
+        x0, y0, x1, y1 = bounds
+        width = self.grid.width
+        return (index // width - y0) * (x1 - x0) + index % width - x0
+
+    def _plane(self, bounds):
+        """
+        Return the neighbour masks and costs of the nodes inside bounds,
+        indexed as by _local, with the steps that leave bounds cleared,
+        together with the moves of each mask and the offset of each
+        step, see _moves
+
+        @type self: Abstraction
+        @type bounds: (int, int, int, int)
+        @rtype: (bytearray, bytearray, list[list[(int, int, int)]],
+                 list[int])
+        """
+        x0, y0, x1, y1 = bounds
+        width = self.grid.width
+        masks = self.grid.neighbour_masks()
+        costs = self.grid.costs
+        local_width = x1 - x0
+        local_masks = bytearray()
+        local_costs = bytearray()
+        for y in range(y0, y1):
+            local_masks += masks[y * width + x0:y * width + x1]
+            local_costs += costs[y * width + x0:y * width + x1]
+        for side, part in [((0, -1), slice(0, local_width)),
+                           ((0, 1), slice(-local_width, None)),
+                           ((-1, 0), slice(0, None, local_width)),
+                           ((1, 0), slice(local_width - 1, None,
+                                          local_width))]:
+            local_masks[part] = local_masks[part].translate(
+                EDGE_TABLES[side])
+        moves, offsets = self._moves(local_width)
+        return local_masks, local_costs, moves, offsets
+
+    def _moves(self, local_width):
+        """
+        Return, for each neighbour mask, the offset within bounds
+        local_width nodes wide, half the length and the index in STEPS
+        of each step it allows, and the offset of each step in STEPS,
+        worked out once for each width
+
+        @type self: Abstraction
+        @type local_width: int
+        @rtype: (list[list[(int, int, int)]], list[int])
+        """
+        tables = self._move_tables.get(local_width)
+        if tables is None:
+            tables = ([[(dy * local_width + dx, step >> 1, k)
+                        for k, (dx, dy, step) in enumerate(STEPS)
+                        if mask >> k & 1]
+                       for mask in range(256)],
+                      [dy * local_width + dx for dx, dy, step in STEPS])
+            self._move_tables[local_width] = tables
+        return tables
+
+    def _search(self, begin, plane, targets=None):
+        """
+        Run Dijkstra's algorithm from the node with index begin within
+        the bounds of plane, see _plane, until every node with an index
+        in targets is settled, or every node it can reach if targets is
+        None, and return the costs of the nodes, indexed as by _local,
+        and the index in STEPS of the step each was reached by.
+        Unreached nodes cost UNREACHED; the costs of nodes other than
+        targets may not be final.
+
+        The open set is a heapq list of costs shifted left past the
+        node index and or-ed with it, with stale entries skipped, which
+        is quicker than IndexedHeap or tuples for these small searches.
+
+        @type self: Abstraction
+        @type begin: int
+        @type plane: (bytearray, bytearray, list[list[(int, int, int)]],
+                     list[int])
+        @type targets: list[int] | None
+        @rtype: (list[int], bytearray)
+        """
+        masks, costs, moves = plane[:3]
+        size = len(masks)
+        shift = size.bit_length()
+        low = (1 << shift) - 1
+        dist = [UNREACHED] * size
+        via = bytearray(size)
+        wanted = bytearray(size)
+        left = -1
+        if targets is not None:
+            for index in targets:
+                wanted[index] = 1
+            left = sum(wanted)
+            if not left:
+                return dist, via
+        weighted = self.grid.weighted
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        dist[begin] = 0
+        open_heap = [begin]
+        while open_heap:
+            entry = heappop(open_heap)
+            g = entry >> shift
+            current = entry & low
+            if g > dist[current]:
+                continue
+            if wanted[current]:
+                left -= 1
+                if not left:
+                    break
+            here = costs[current]
+            for offset, half, k in moves[masks[current]]:
+                index = current + offset
+                if weighted:
+                    fee = g + half * (here + costs[index])
+                else:
+                    fee = g + half * 2
+                if fee < dist[index]:
+                    dist[index] = fee
+                    via[index] = k
+                    heappush(open_heap, fee << shift | index)
+        return dist, via
+
+    def _steps(self, via, begin, end, offsets):
+        """
+        Return the steps of the path from begin to end found by
+        _search, as the indices in STEPS of each step, one byte each,
+        following via back from end by the offsets of the steps, see
+        _moves
+
+        @type self: Abstraction
+        @type via: bytearray
+        @type begin: int
+        @type end: int
+        @type offsets: list[int]
+        @rtype: bytes
+        """
+        steps = bytearray()
+        current = end
+        while current != begin:
+            k = via[current]
+            steps.append(k)
+            current -= offsets[k]
+        steps.reverse()
+        return bytes(steps)
+
+    def _walk(self, start, steps):
+        """
+        Return the indices of the nodes reached by taking steps from
+        the node with index start, without start
+
+        @type self: Abstraction
+        @type start: int
+        @type steps: bytes
+        @rtype: list[int]
+        """
+        width = self.grid.width
+        offsets = [dy * width + dx for dx, dy, step in STEPS]
+        path = []
+        for k in steps:
+            start += offsets[k]
+            path.append(start)
+        return path
+
+    def _connect(self, index):
+        """
+        Return the cost and steps of the shortest path inside its sector
+        from the node with index index to each transition of the sector
+        it can reach
+
+        @type self: Abstraction
+        @type index: int
+        @rtype: dict[int, (int, bytes)]
+        """
+        sector = self.sector_of(index)
+        bounds = self._bounds(sector)
+        plane = self._plane(bounds)
+        local = {self._local(node, bounds): node
+                 for node in self.members.get(sector, [])}
+        begin = self._local(index, bounds)
+        dist, via = self._search(begin, plane, list(local))
+        return {node: (dist[at], self._steps(via, begin, at, plane[3]))
+                for at, node in local.items() if dist[at] != UNREACHED}
+
+    def find_path(self, start_node, target_node):
+        """
+        Return a list of Nodes from start_node to target_node, without
+        start_node, like Grid.retrace_path, or an empty list if there is
+        no path. See the module docstring for how far from shortest the
+        path may be. If the map changed since the abstraction was built,
+        it is rebuilt first.
+
+        @type self: Abstraction
+        @type start_node: Node
+        @type target_node: Node
+        @rtype: list[Node]
+
+        >>> from grid import Grid
+        >>> g = Grid("", ["B...+...", "....+...", "........", "....+..T"])
+        >>> a = Abstraction(g, 2)
+        >>> [str(n) for n in a.find_path(g.boat, g.treasure)]
+        ['True 1 1', 'True 2 1', 'True 3 1', 'True 3 2', 'True 4 2', \
+'True 5 3', 'True 6 3', 'True 7 3']
+        >>> g = Grid("", ["B.......", "........", "....+...", "....+..T"])
+        >>> a = Abstraction(g, 2)
+        >>> g.set_navigable(4, 1, False)
+        >>> [str(n) for n in a.find_path(g.boat, g.treasure)]
+        ['True 1 1', 'True 2 1', 'True 3 0', 'True 4 0', 'True 5 1', \
+'True 6 1', 'True 7 1', 'True 7 2', 'True 7 3']
+        """
+        grid = self.grid
+        width = grid.width
+        if grid.component(start_node) == 0 or \
+                grid.component(start_node) != grid.component(target_node):
+            return []
+        start = start_node.grid_y * width + start_node.grid_x
+        target = target_node.grid_y * width + target_node.grid_x
+        if start == target:
+            return []
+        if self.map_version != grid.map_version:
+            self._build()
+        path = None
+        if not self._near(start, target):
+            from_start = {} if start in self.edges else self._connect(start)
+            to_target = {} if target in self.edges else \
+                self._connect(target)
+            route = self._abstract_route(start, target, from_start,
+                                         to_target)
+            if route is not None:
+                path = self._refine(route, from_start, to_target)
+        if path is None:
+            grid.find_path(start_node, target_node)
+            return grid.retrace_path(start_node, target_node)
+        return [Node(True, index % width, index // width) for index in path]
+
+    def _near(self, start, target):
+        """
+        Return True if the nodes with indices start and target are in
+        the same sector or in touching sectors
+
+        @type self: Abstraction
+        @type start: int
+        @type target: int
+        @rtype: bool
+        """
+        width = self.grid.width
+        size = self.sector
+        return abs(start % width // size - target % width // size) <= 1 and \
+            abs(start // width // size - target // width // size) <= 1
+
+    def _abstract_route(self, start, target, from_start, to_target):
+        """
+        Return the abstract nodes on the cheapest route from start to
+        target through the abstract graph, or None if there is none.
+        from_start and to_target link start and target to the
+        transitions of their sectors, see _connect, unless they are
+        transitions themselves, when they are empty and their own edges
+        are used.
+
+        @type self: Abstraction
+        @type start: int
+        @type target: int
+        @type from_start: dict[int, (int, bytes)]
+        @type to_target: dict[int, (int, bytes)]
+        @rtype: list[int] | None
+        """
+        width = self.grid.width
+        tx = target % width
+        ty = target // width
+        no_edges = {}
+        dist = {start: 0}
+        parent = {start: -1}
+        open_heap = [(0, 0, start)]
+        while open_heap:
+            f, g, current = heapq.heappop(open_heap)
+            if g > dist[current]:
+                continue
+            if current == target:
+                route = []
+                while current != -1:
+                    route.append(current)
+                    current = parent[current]
+                route.reverse()
+                return route
+            if current == start and from_start:
+                out = [(index, cost) for index, (cost, steps)
+                       in from_start.items()]
+            else:
+                if self._pending and current in self.edges:
+                    self._ready(current)
+                out = self.edges.get(current, no_edges).items()
+                if current in to_target:
+                    out = list(out) + [(target, to_target[current][0])]
+            for index, cost in out:
+                fee = g + cost
+                if fee >= dist.get(index, UNREACHED):
+                    continue
+                dist[index] = fee
+                parent[index] = current
+                ax = abs(index % width - tx)
+                ay = abs(index // width - ty)
+                heapq.heappush(open_heap, (
+                    fee + 10 * (ax + ay) - 6 * min(ax, ay), fee, index))
+        return None
+
+    def _refine(self, route, from_start, to_target):
+        """
+        Return the indices of the nodes along route, without its first
+        node. Each step between two nodes of the same sector follows
+        the steps kept for it, in paths or in from_start and to_target,
+        so nothing is searched again. Return None if a border crossing
+        cannot be taken on the map as it is.
+
+        @type self: Abstraction
+        @type route: list[int]
+        @type from_start: dict[int, (int, bytes)]
+        @type to_target: dict[int, (int, bytes)]
+        @rtype: list[int] | None
+        """
+        width = self.grid.width
+        masks = self.grid.neighbour_masks()
+        start = route[0]
+        target = route[-1]
+        path = []
+        for a, b in zip(route, route[1:]):
+            if a == start and b in from_start:
+                path += self._walk(a, from_start[b][1])
+            elif b == target and a in to_target:
+                path += self._walk(a, _reverse(to_target[a][1]))
+            elif self.sector_of(a) == self.sector_of(b):
+                steps = self.paths.get((a, b))
+                if steps is None:
+                    steps = _reverse(self.paths[(b, a)])
+                path += self._walk(a, steps)
+            else:
+                k = BITS.get((b % width - a % width, b // width - a // width))
+                if k is None or not masks[a] >> k & 1:
+                    return None
+                path.append(b)
+        return path
+
+    def save(self, path):
+        """
+        Save the abstraction to the file at path as JSON, working out
+        the sectors no query has reached first, see precompute
+
+        @type self: Abstraction
+        @type path: str
+        @rtype: None
+        """
+        self.precompute()
+        edges = [[a, b, cost] for a, out in self.edges.items()
+                 for b, cost in out.items() if a < b]
+        paths = [[a, b, steps.hex()] for (a, b), steps in self.paths.items()]
+        with open(path, "w") as file:
+            json.dump({"version": FORMAT_VERSION, "sector": self.sector,
+                       "width": self.grid.width, "height": self.grid.height,
+                       "edges": edges, "paths": paths}, file)
+
+    @classmethod
+    def load(cls, path, grid):
+        """
+        Return the abstraction of grid saved to path by save
+
+        @type path: str
+        @type grid: Grid
+        @rtype: Abstraction
+        """
+        with open(path) as file:
+            data = json.load(file)
+        if data["version"] != FORMAT_VERSION or \
+                (data["width"], data["height"]) != (grid.width, grid.height):
+            raise ValueError("{} is not an abstraction of this grid".format(
+                path))
+        abstraction = cls.__new__(cls)
+        abstraction.grid = grid
+        abstraction.sector = data["sector"]
+        abstraction.map_version = grid.map_version
+        abstraction._move_tables = {}
+        abstraction._pending = set()
+        abstraction.edges = {}
+        abstraction.members = {}
+        for a, b, cost in data["edges"]:
+            abstraction._link(a, b, cost)
+        abstraction.paths = {(a, b): bytes.fromhex(steps)
+                             for a, b, steps in data["paths"]}
+        return abstraction
@@ -0,0 +1,296 @@
+"""Spatial index
+
+Keeps the positions of many objects on a Grid, such as boats and
+treasures, in a uniform grid of square buckets, so that finding the
+objects in range of a node, or the nearest ones to it, only looks at
+the buckets around it instead of at every object.
+
+Distances are measured as by Node.distance. Since that is at least 10
+times the larger of the distances along x and along y, the objects
+closer than a radius all lie in a square of buckets around the node.
+
+    >>> from grid import Grid
+    >>> g = Grid("", ["B.........", "..........", ".........T"])
+    >>> index = SpatialIndex(g, 4)
+    >>> index.insert("wreck", 3, 0)
+    >>> index.within(g.boat, 40)
+    [('boat', 0), ('wreck', 30)]
+    >>> g.move("E")
+    >>> index.nearest(g.node(9, 0), 2)
+    [('treasure', 20), ('wreck', 60)]
+    >>> index.nearest(g.node(9, 0), 0)
+    []
+"""
+
+import heapq
+
+# the size of a bucket by default, in nodes along each side
+BUCKET = 16
+
+# the keys of the boat and treasure of the grid in its index
+BOAT = "boat"
+TREASURE = "treasure"
+
+
+def _distance(ax, ay, bx, by):
+    """
+    Return the distance between ax, ay and bx, by, as by Node.distance
+
+    @type ax: int
+    @type ay: int
+    @type bx: int
+    @type by: int
+    @rtype: int
+    """
+    dx = abs(ax - bx)
+    dy = abs(ay - by)
+    return 10 * (dx + dy) - 6 * (dx if dx < dy else dy)
+
+
+class SpatialIndex:
+    """
+    The positions of objects on a grid, bucketed for range and nearest
+    neighbour queries, kept up to date as they move.
+
+    === Attributes: ===
+    @type grid: Grid
+       the grid the objects are on; its index is set to this index
+    @type bucket: int
+       the length of the side of a bucket, in nodes
+    """
+    def __init__(self, grid, bucket=BUCKET):
+        """
+        Make an index of the boat and treasure of grid, under the keys
+        BOAT and TREASURE, and attach it to grid, which moves the boat
+        in it on every move
+
+        @type self: SpatialIndex
+        @type grid: Grid
+        @type bucket: int
+        @rtype: None
+        """
+        self.grid = grid
+        self.bucket = bucket
+        self._columns = -(-grid.width // bucket)
+        self._rows = -(-grid.height // bucket)
+        self._positions = {}
+        self._buckets = {}
+        self.insert(BOAT, grid.boat.grid_x, grid.boat.grid_y)
+        self.insert(TREASURE, grid.treasure.grid_x, grid.treasure.grid_y)
+        grid.index = self
+
+    def __len__(self):
+        """
+        Return the number of objects in this index
+
+        @type self: SpatialIndex
+        @rtype: int
+        """
+        return len(self._positions)
+
+    def __contains__(self, key):
+        """
+        Return True if there is an object under key in this index
+
+        @type self: SpatialIndex
+        @type key: object
+        @rtype: bool
+        """
+        return key in self._positions
+
+    def _bucket_of(self, x, y):
+        """
+        Return the number of the bucket holding x, y
+
+        @type self: SpatialIndex
+        @type x: int
+        @type y: int
+        @rtype: int
+        """
+        return y // self.bucket * self._columns + x // self.bucket
+
+    def position(self, key):
+        """
+        Return the coordinates x, y of the object under key
+
+        @type self: SpatialIndex
+        @type key: object
+        @rtype: (int, int)
+        """
+        return self._positions[key]
+
+    def insert(self, key, x, y):
+        """
+        Add an object under key at x, y, or move it there if there
+        already is one
+
+        @type self: SpatialIndex
+        @type key: object
+        @type x: int
+        @type y: int
+        @rtype: None
+        """
+        if not (0 <= x < self.grid.width and 0 <= y < self.grid.height):
+            raise ValueError("{!r} must be on the map".format(key))
+        if key in self._positions:
+            self.move(key, x, y)
+            return
+        self._positions[key] = (x, y)
+        self._buckets.setdefault(self._bucket_of(x, y), {})[key] = (x, y)
+
+    def remove(self, key):
+        """
+        Remove the object under key
+
+        @type self: SpatialIndex
+        @type key: object
+        @rtype: None
+        """
+        x, y = self._positions.pop(key)
+        number = self._bucket_of(x, y)
+        del self._buckets[number][key]
+        if not self._buckets[number]:
+            del self._buckets[number]
+
+    def move(self, key, x, y):
+        """
+        Move the object under key to x, y. Only an object that leaves
+        its bucket is moved between buckets.
+
+        @type self: SpatialIndex
+        @type key: object
+        @type x: int
+        @type y: int
+        @rtype: None
+        """
+        old_x, old_y = self._positions[key]
+        self._positions[key] = (x, y)
+        old = self._bucket_of(old_x, old_y)
+        new = self._bucket_of(x, y)
+        if old == new:
+            self._buckets[old][key] = (x, y)
+            return
+        del self._buckets[old][key]
+        if not self._buckets[old]:
+            del self._buckets[old]
+        self._buckets.setdefault(new, {})[key] = (x, y)
+
+    def move_boat(self, boat):
+        """
+        Tell the index the boat of the grid has moved to the node boat
+
+        @type self: SpatialIndex
+        @type boat: Node
+        @rtype: None
+        """
+        self.move(BOAT, boat.grid_x, boat.grid_y)
+
+    def move_many(self, keys, xs, ys):
+        """
+        Move each object under keys to the matching x in xs and y in
+        ys, as for one tick of a fleet
+
+        @type self: SpatialIndex
+        @type keys: list[object]
+        @type xs: list[int]
+        @type ys: list[int]
+        @rtype: None
+        """
+        for key, x, y in zip(keys, xs, ys):
+            self.move(key, x, y)
+
+    def within(self, node, radius):
+        """
+        Return the objects closer to node than radius, as get_treasure
+        measures range, as pairs of key and distance, nearest first
+
+        @type self: SpatialIndex
+        @type node: Node
+        @type radius: int
+        @rtype: list[(object, int)]
+        """
+        x = node.grid_x
+        y = node.grid_y
+        reach = -(-radius // 10)
+        size = self.bucket
+        buckets = self._buckets
+        found = []
+        for row in range(max(0, (y - reach) // size),
+                         min(self._rows, (y + reach) // size + 1)):
+            for column in range(max(0, (x - reach) // size),
+                                min(self._columns, (x + reach) // size + 1)):
+                for key, (ox, oy) in buckets.get(
+                        row * self._columns + column, {}).items():
+                    distance = _distance(x, y, ox, oy)
+                    if distance < radius:
+                        found.append((key, distance))
+        found.sort(key=lambda pair: pair[1])
+        return found
+
+    def nearest(self, node, count):
+        """
+        Return the count objects nearest to node, or all of them if
+        there are fewer, as pairs of key and distance, nearest first,
+        or none if count is not positive. Rings of buckets are searched outwards from the bucket of node
+        until no farther ring can hold anything nearer.
+
+        @type self: SpatialIndex
+        @type node: Node
+        @type count: int
+        @rtype: list[(object, int)]
+        """
+        if count <= 0:
+            return []
+        x = node.grid_x
+        y = node.grid_y
+        size = self.bucket
+        column = x // size
+        row = y // size
+        buckets = self._buckets
+        best = []
+        ring = 0
+        while ring <= max(self._columns, self._rows):
+            for r in range(row - ring, row + ring + 1):
+                if not 0 <= r < self._rows:
+                    continue
+                edge = r == row - ring or r == row + ring
+                for c in range(column - ring, column + ring + 1,
+                               1 if edge else max(1, 2 * ring)):
+                    if not 0 <= c < self._columns:
+                        continue
+                    for key, (ox, oy) in buckets.get(
+                            r * self._columns + c, {}).items():
+                        pair = (-_distance(x, y, ox, oy), id(key), key)
+                        if len(best) < count:
+                            heapq.heappush(best, pair)
+                        elif pair > best[0]:
+                            heapq.heapreplace(best, pair)
+            # every node in the next ring is at least this far along
+            # x or y, so at least 10 times that by Node.distance
+            if len(best) == count and -best[0][0] <= 10 * (ring * size + 1):
+                break
+            ring += 1
+        return [(key, -distance)
+                for distance, tag, key in sorted(best, reverse=True)]
+
+    def within_many(self, nodes, radius):
+        """
+        Return the result of within for each node in nodes
+
+        @type self: SpatialIndex
+        @type nodes: list[Node]
+        @type radius: int
+        @rtype: list[list[(object, int)]]
+        """
+        return [self.within(node, radius) for node in nodes]
+
+    def nearest_many(self, nodes, count):
+        """
+        Return the result of nearest for each node in nodes
+
+        @type self: SpatialIndex
+        @type nodes: list[Node]
+        @type count: int
+        @rtype: list[list[(object, int)]]
+        """
+        return [self.nearest(node, count) for node in nodes]
@@ -0,0 +1,580 @@
+"""Tiled maps
+
+A TiledGrid plans on a map kept on disk, cut into square tiles by
+compile_tiles, for maps too large to hold in memory as a Grid. Tiles
+are read from the file the first time a search or a move reaches them,
+and at most budget bytes of them are kept, dropping the least recently
+used first, so how much of the map is in memory does not depend on its
+size.
+
+In memory a tile is a plane of bytes, one per node, holding the cost of
+the node, or 0 for an island. On disk a tile holds nav packed eight
+nodes to a byte, as in the compiled map format of Grid, or that plane
+itself if the map is weighted. Tiles on the right and bottom edges are
+padded with islands.
+
+The search state of find_path is kept in dicts holding only the nodes
+the search reached, instead of in arrays covering the whole map, so it
+grows with the search rather than with the map. It counts against the
+budget too, at SEARCH_BYTES per node reached: tiles are dropped to make
+room for it as it grows, and a search that would need more than the
+budget on its own gives up, see find_path.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "chart.tiles")
+    >>> compile_tiles("", path, ["B..+....", ".+.+.++.", ".+...+.T"], 4)
+    >>> g = TiledGrid(path, 32 + 20 * SEARCH_BYTES)
+    >>> g.find_path(g.boat, g.treasure)
+    True
+    >>> g.treasure.gcost
+    100
+    >>> [str(n) for n in g.retrace_path(g.boat, g.treasure)][:3]
+    ['True 1 0', 'True 2 1', 'True 3 2']
+    >>> len(g._tiles), g.loads
+    (2, 2)
+"""
+
+import struct
+from collections import OrderedDict
+
+from grid import (Grid, IndexedHeap, Node, NodeMap, STEPS, _legend_tables,
+                  _pack_bits, _unpack_bits)
+
+# the length of the side of a tile by default, in nodes
+TILE = 256
+
+# the bytes of tiles and search state a TiledGrid keeps in memory by
+# default
+BUDGET = 64 << 20
+
+# the bytes of search state find_path holds for each node it reaches,
+# in its dicts, set and heap, as measured on CPython
+SEARCH_BYTES = 300
+
+# magic, version, flags, width, height, tile, boat x, boat y,
+# treasure x, treasure y
+TILED_HEADER = struct.Struct("<4sHHIIIIIII")
+TILED_MAGIC = b"TILE"
+TILED_VERSION = 1
+
+# the flag of a tiled map whose tiles hold costs instead of nav
+TILED_WEIGHTED = 1
+
+
+def compile_tiles(file_path, path, text_grid=None, tile=TILE, legend=None):
+    """
+    Write the map given by file_path or text_grid, as for Grid, to path
+    as a tiled map of tiles tile nodes on a side. The rows are read one
+    band of tiles at a time, so the whole map is never in memory.
+
+    @type file_path: str
+    @type path: str
+    @type text_grid: list[str] | None
+    @type tile: int
+    @type legend: dict[str, int | None] | None
+       as for Grid.__init__
+    @rtype: None
+    """
+    nav_table, cost_table = _legend_tables(legend)
+    if file_path == "":
+        rows = (row.encode("ascii") for row in text_grid)
+    else:
+        rows = Grid.read_rows(file_path)
+    if cost_table is not None:
+        # islands cost 0, so one plane holds both nav and costs
+        cost_table = bytes(cost if keep else 0
+                           for cost, keep in zip(cost_table, nav_table))
+    width = None
+    height = 0
+    boat = None
+    treasure = None
+    band = []
+    with open(path, "wb") as file:
+        file.write(bytes(TILED_HEADER.size))
+        for row in rows:
+            if width is None:
+                width = len(row)
+            if boat is None and row.find(b"B") != -1:
+                boat = (row.find(b"B"), height)
+            if treasure is None and row.find(b"T") != -1:
+                treasure = (row.find(b"T"), height)
+            band.append(row.translate(nav_table if cost_table is None
+                                      else cost_table))
+            height += 1
+            if len(band) == tile:
+                _write_band(file, band, width, tile, cost_table is not None)
+                band = []
+        if boat is None or treasure is None:
+            raise ValueError("the map needs both a boat and a treasure")
+        if band:
+            _write_band(file, band, width, tile, cost_table is not None)
+        file.seek(0)
+        file.write(TILED_HEADER.pack(
+            TILED_MAGIC, TILED_VERSION,
+            0 if cost_table is None else TILED_WEIGHTED,
+            width, height, tile, boat[0], boat[1], treasure[0], treasure[1]))
+
+
+def _write_band(file, band, width, tile, weighted):
+    """
+    Write the tiles of band, up to tile translated rows of the map, to
+    file, left to right, padded with islands
+
+    @type file: BinaryIO
+    @type band: list[bytes]
+    @type width: int
+    @type tile: int
+    @type weighted: bool
+    @rtype: None
+    """
+    blank = bytes(tile) * (tile - len(band))
+    for x in range(0, width, tile):
+        plane = b"".join(row[x:x + tile].ljust(tile, b"\x00")
+                         for row in band) + blank
+        file.write(plane if weighted else _pack_bits(plane))
+
+
+class TiledGrid:
+    """
+    A map read tile by tile from a file written by compile_tiles, with
+    the boat, searches and moves of a Grid.
+
+    === Attributes: ===
+    @type width: int
+       the width of the map in nodes
+    @type height: int
+       the height of the map in nodes
+    @type tile: int
+       the length of the side of a tile, in nodes
+    @type budget: int
+       the bytes of tiles and search state kept in memory at most
+    @type capacity: int
+       how many tiles are kept in memory at most between searches
+    @type map: NodeMap
+       map[x][y] is the Node with coordinates x, y, as for Grid
+    @type weighted: bool
+       whether nodes may cost more than 1, as for Grid
+    @type boat: Node
+       the current location of the boat
+    @type treasure: Node
+       the location of the treasure
+    @type expanded: int
+       the number of nodes expanded by the last call to find_path
+    @type version: int
+       goes up by one every time the boat moves
+    @type loads: int
+       the number of tiles read from the file so far
+    @type index: SpatialIndex | None
+       the spatial index attached to this grid, if any, see spatial.py
+    @type corner_cutting: bool
+       as for Grid, see set_corner_cutting
+    @type over_budget: bool
+       whether the last call to find_path gave up because its search
+       state outgrew the budget
+    """
+    def __init__(self, path, budget=BUDGET):
+        """
+        Open the tiled map at path, keeping up to budget bytes of its
+        tiles and search state in memory. The budget must hold at least
+        one tile and the search state of one node, or ValueError is
+        raised.
+
+        @type self: TiledGrid
+        @type path: str
+        @type budget: int
+        @rtype: None
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "chart.tiles")
+        >>> compile_tiles("", path, ["B.++", ".+..", "...T"], 2)
+        >>> TiledGrid(path, 4)
+        Traceback (most recent call last):
+        ...
+        ValueError: budget must hold a tile and a node: at least 304 bytes
+        """
+        self._file = open(path, "rb")
+        magic, version, flags, width, height, tile, bx, by, tx, ty = \
+            TILED_HEADER.unpack(self._file.read(TILED_HEADER.size))
+        if magic != TILED_MAGIC or version != TILED_VERSION:
+            self._file.close()
+            raise ValueError("not a tiled map: {}".format(path))
+        if budget < tile * tile + SEARCH_BYTES:
+            self._file.close()
+            raise ValueError("budget must hold a tile and a node: at least "
+                             "{} bytes".format(tile * tile + SEARCH_BYTES))
+        self.width = width
+        self.height = height
+        self.tile = tile
+        self.weighted = bool(flags & TILED_WEIGHTED)
+        self.budget = budget
+        self.capacity = max(1, budget // (tile * tile))
+        self._columns = -(-width // tile)
+        self._size = tile * tile if self.weighted else -(-tile * tile // 8)
+        self._tiles = OrderedDict()
+        self.loads = 0
+        self.map = NodeMap(self)
+        self.boat = Node(True, bx, by)
+        self.treasure = Node(True, tx, ty)
+        self._under = ord(".")
+        self.expanded = 0
+        self.version = 0
+        self.index = None
+        self.corner_cutting = True
+        self.over_budget = False
+        self._held = 0
+
+    def close(self):
+        """
+        Close the file of this map
+
+        @type self: TiledGrid
+        @rtype: None
+        """
+        self._file.close()
+
+    def _plane(self, number):
+        """
+        Return the plane of the tile numbered number, counting left to
+        right and top to bottom, reading it from the file if it is not
+        in memory and dropping the least recently used tiles to make
+        room for it beside the search state held
+
+        @type self: TiledGrid
+        @type number: int
+        @rtype: bytearray
+        """
+        tiles = self._tiles
+        plane = tiles.get(number)
+        if plane is not None:
+            tiles.move_to_end(number)
+            return plane
+        self._file.seek(TILED_HEADER.size + number * self._size)
+        data = self._file.read(self._size)
+        if self.weighted:
+            plane = bytearray(data)
+        else:
+            plane = _unpack_bits(data, self.tile * self.tile)
+        self.loads += 1
+        room = max(1, (self.budget - self._held) // (self.tile * self.tile))
+        while len(tiles) >= min(room, self.capacity):
+            tiles.popitem(last=False)
+        tiles[number] = plane
+        return plane
+
+    def _cost(self, grid_x, grid_y):
+        """
+        Return the cost of the node with coordinates grid_x, grid_y, or
+        0 if it is an island or off the map
+
+        @type self: TiledGrid
+        @type grid_x: int
+        @type grid_y: int
+        @rtype: int
+        """
+        if not (0 <= grid_x < self.width and 0 <= grid_y < self.height):
+            return 0
+        tile = self.tile
+        plane = self._plane(grid_y // tile * self._columns + grid_x // tile)
+        return plane[grid_y % tile * tile + grid_x % tile]
+
+    def node(self, grid_x, grid_y):
+        """
+        Return a new Node for the cell with coordinates grid_x, grid_y
+
+        @type self: TiledGrid
+        @type grid_x: int
+        @type grid_y: int
+        @rtype: Node
+        """
+        return Node(self._cost(grid_x, grid_y) != 0, grid_x, grid_y)
+
+    def viewport(self, radius):
+        """
+        Return the map within radius nodes of the boat in each
+        direction, as a string, as Grid.viewport does. Every sea node
+        is shown as a dot.
+
+        @type self: TiledGrid
+        @type radius: int
+        @rtype: str
+        """
+        rows = []
+        for y in range(max(0, self.boat.grid_y - radius),
+                       min(self.height, self.boat.grid_y + radius + 1)):
+            row = bytearray()
+            for x in range(max(0, self.boat.grid_x - radius),
+                           min(self.width, self.boat.grid_x + radius + 1)):
+                if (x, y) == (self.boat.grid_x, self.boat.grid_y):
+                    row.append(ord("B"))
+                elif (x, y) == (self.treasure.grid_x, self.treasure.grid_y):
+                    row.append(ord("T"))
+                else:
+                    row.append(ord(".") if self._cost(x, y) else ord("+"))
+            rows.append(row)
+        return b"\n".join(rows).decode("ascii")
+
+    def move_helper(self, x, y):
+        """
+        Move the boat x nodes east and y nodes north, as Grid.move_helper
+
+        @type self: TiledGrid
+        @type x: int
+        @type y: int
+        @rtype: None
+        """
+        a_ = self.boat.grid_x + x
+        b_ = self.boat.grid_y - y
+        if self._cost(a_, b_) == 0:
+            raise ValueError("sorry m8, path cannot be manuevered")
+        self.boat = Node(True, a_, b_)
+        self.version += 1
+        if self.index is not None:
+            self.index.move_boat(self.boat)
+
+    # the same directions as a Grid, through move_helper
+    move = Grid.move
+
+    def neighbourhood(self, node):
+        """
+        Return each neighbouring node of node on the map, as
+        Grid.neighbourhood does
+
+        @type self: TiledGrid
+        @type node: Node
+        @rtype: list[Node]
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "chart.tiles")
+        >>> compile_tiles("", path, ["B.++", ".+..", "...T"], 2)
+        >>> g = TiledGrid(path)
+        >>> [str(n) for n in g.neighbourhood(g.node(2, 1))]
+        ['True 1 2', 'False 1 1', 'True 1 0', 'True 2 2', 'False 2 0', \
+'True 3 2', 'True 3 1', 'False 3 0']
+        """
+        return [self.node(node.grid_x + dx, node.grid_y + dy)
+                for dx in [-1, 0, 1] for dy in [1, 0, -1]
+                if (dx != 0 or dy != 0) and
+                0 <= node.grid_x + dx < self.width and
+                0 <= node.grid_y + dy < self.height]
+
+    def neighbours(self, node):
+        """
+        Return the neighbours node can step to, as pairs of the
+        neighbouring Node and the length of the step to it, as
+        Grid.neighbours does
+
+        @type self: TiledGrid
+        @type node: Node
+        @rtype: list[(Node, int)]
+        """
+        x = node.grid_x
+        y = node.grid_y
+        return [(Node(True, x + dx, y + dy), step)
+                for dx, dy, step in STEPS
+                if self._cost(x + dx, y + dy) and
+                self._passes(x, y, dx, dy)]
+
+    def _passes(self, x, y, dx, dy):
+        """
+        Return False if the step dx, dy from x, y passes between two
+        islands while corner cutting is not allowed
+
+        @type self: TiledGrid
+        @type x: int
+        @type y: int
+        @type dx: int
+        @type dy: int
+        @rtype: bool
+        """
+        return self.corner_cutting or dx == 0 or dy == 0 or \
+            self._cost(x + dx, y) != 0 or self._cost(x, y + dy) != 0
+
+    def set_corner_cutting(self, allowed):
+        """
+        Allow paths to pass diagonally between two islands that touch
+        at a corner, or not if allowed is False
+
+        @type self: TiledGrid
+        @type allowed: bool
+        @rtype: None
+        """
+        self.corner_cutting = allowed
+
+    def find_path(self, start_node, target_node):
+        """
+        Find the shortest path from start_node to target_node with
+        A-star and link its Nodes through their parents, as
+        Grid.find_path does, loading tiles as the search reaches them
+
+        Nodes in the middle of a tile look up their neighbours in its
+        plane directly; only nodes on the edge of a tile go through
+        _cost. Since there are no bodies of water to check first, a
+        search for a target that cannot be reached expands every node
+        it can reach before it returns False.
+
+        Tiles are dropped as the search state grows, so the two stay
+        within budget. If the search state alone would leave no room
+        for a tile, the search gives up, sets over_budget and returns
+        False.
+
+        @type self: TiledGrid
+        @type start_node: Node
+        @type target_node: Node
+        @rtype: bool
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "chart.tiles")
+        >>> compile_tiles("", path, ["B......", "......T"], 4)
+        >>> g = TiledGrid(path, 16 + 5 * SEARCH_BYTES)
+        >>> g.find_path(g.boat, g.treasure), g.over_budget
+        (False, True)
+        >>> g.budget += 10 * SEARCH_BYTES
+        >>> g.find_path(g.boat, g.treasure), g.over_budget
+        (True, False)
+        """
+        start_node.set_gcost(0)
+        start_node.set_hcost(start_node.distance(target_node))
+        start_node.set_parent(None)
+        target_node.set_parent(None)
+        self.expanded = 0
+        self.over_budget = False
+        if self._cost(start_node.grid_x, start_node.grid_y) == 0 or \
+                self._cost(target_node.grid_x, target_node.grid_y) == 0:
+            return False
+        try:
+            return self._search(start_node, target_node)
+        finally:
+            self._held = 0
+
+    def _search(self, start_node, target_node):
+        """
+        Run the search of find_path, keeping _held up to date with the
+        bytes of search state it holds
+
+        @type self: TiledGrid
+        @type start_node: Node
+        @type target_node: Node
+        @rtype: bool
+        """
+        width = self.width
+        tile = self.tile
+        columns = self._columns
+        cost = self._cost
+        passes = self._passes
+        tx = target_node.grid_x
+        ty = target_node.grid_y
+        start = start_node.grid_y * width + start_node.grid_x
+        target = ty * width + tx
+        limit = (self.budget - tile * tile) // SEARCH_BYTES
+        inner = [(dy * tile + dx, dx, dy, step) for dx, dy, step in STEPS]
+        gcost = {start: 0}
+        parent = {start: -1}
+        closed = set()
+        open_heap = IndexedHeap()
+        open_heap.push(start, (start_node.hcost, start_node.hcost, 0))
+        counter = 1
+        expanded = 0
+
+        while len(open_heap) > 0:
+            current = open_heap.pop()
+            closed.add(current)
+            expanded += 1
+            if current == target:
+                break
+            if len(gcost) > limit:
+                self.expanded = expanded
+                self.over_budget = True
+                return False
+            self._held = len(gcost) * SEARCH_BYTES
+            cx = current % width
+            cy = current // width
+            lx = cx % tile
+            ly = cy % tile
+            plane = self._plane(cy // tile * columns + cx // tile)
+            at = ly * tile + lx
+            here = plane[at]
+            middle = 0 < lx < tile - 1 and 0 < ly < tile - 1
+            g = gcost[current]
+            for offset, dx, dy, step in inner:
+                x = cx + dx
+                y = cy + dy
+                if middle:
+                    there = plane[at + offset]
+                    if there and dx and dy and not self.corner_cutting and \
+                            not plane[at + dx] and not plane[at + dy * tile]:
+                        continue
+                else:
+                    there = cost(x, y)
+                    if there and not passes(cx, cy, dx, dy):
+                        continue
+                if not there:
+                    continue
+                index = y * width + x
+                if index in closed:
+                    continue
+                moving_fee = g + (step >> 1) * (here + there)
+                if moving_fee >= gcost.get(index, moving_fee + 1):
+                    continue
+                gcost[index] = moving_fee
+                parent[index] = current
+                ax = abs(x - tx)
+                ay = abs(y - ty)
+                h = 10 * (ax + ay) - 6 * (ax if ax < ay else ay)
+                if index in open_heap:
+                    open_heap.decrease_key(index, (moving_fee + h, h, counter))
+                else:
+                    open_heap.push(index, (moving_fee + h, h, counter))
+                counter += 1
+        self.expanded = expanded
+        if target not in closed:
+            return False
+        indices = []
+        index = target
+        while index != start:
+            indices.append(index)
+            index = parent[index]
+        before = start_node
+        for index in reversed(indices):
+            if index == target:
+                node = target_node
+            else:
+                node = Node(True, index % width, index // width)
+            node.set_gcost(gcost[index])
+            node.set_hcost(node.distance(target_node))
+            node.set_parent(before)
+            before = node
+        return True
+
+    def retrace_path(self, start_node, target_node):
+        """
+        Return the path linked by find_path from start_node to
+        target_node as a list of Nodes, without start_node, as
+        Grid.retrace_path does, or an empty list if there is none
+
+        @type self: TiledGrid
+        @type start_node: Node
+        @type target_node: Node
+        @rtype: list[Node]
+        """
+        path = []
+        node = target_node
+        while node != start_node:
+            if node is None:
+                return []
+            path.append(node)
+            node = node.parent
+        path.reverse()
+        return path
+
+    def get_treasure(self, s_range):
+        """
+        Return the treasure if it is closer to the boat than s_range,
+        else None, as Grid.get_treasure does
+
+        @type self: TiledGrid
+        @type s_range: int
+        @rtype: Node | None
+        """
+        if self.boat.distance(self.treasure) < s_range:
+            return self.treasure
+        return None
@@ -0,0 +1,155 @@
+"""Wavefront engine
+
+Answers reachability and distance-field queries on the navigability
+plane of a Grid with NumPy array operations, expanding a whole frontier
+of cells at a time instead of one Node at a time.
+
+Both functions take only the steps Grid.neighbour_masks allows, so
+they follow corner_cutting as Grid.find_path does, and distances use
+the same costs as Grid.find_path: 10 for a straight step and 14 for a
+diagonal one, times the mean cost of the two nodes on a weighted grid.
+The arrays they return are indexed [y, x].
+"""
+
+import numpy as np
+
+from grid import STEPS
+
+# bit k of a neighbour mask allows the step STEPS[k]
+BITS = np.arange(len(STEPS))
+
+# distance of a cell that has not been reached
+UNREACHED = np.iinfo(np.int64).max
+
+
+def _padded(grid, buffer=None, dtype=bool):
+    """
+    Return the navigability plane of grid, or buffer, another plane of
+    it, as a flat array of dtype with a border of zeros around it, so
+    that stepping off any navigable cell stays inside the array,
+    together with the flat offsets of the 8 neighbours and their costs,
+    in the order of STEPS
+
+    @type grid: Grid
+    @type buffer: bytearray | None
+    @type dtype: type
+    @rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    width = grid.width + 2
+    plane = np.zeros((grid.height + 2, width), dtype=dtype)
+    plane[1:-1, 1:-1] = np.frombuffer(
+        grid.nav if buffer is None else buffer, dtype=np.uint8).reshape(
+        grid.height, grid.width)
+    offsets = np.array([dy * width + dx for dx, dy, cost in STEPS])
+    costs = np.array([cost for dx, dy, cost in STEPS])
+    return plane.ravel(), offsets, costs
+
+
+def _unpad(grid, flat):
+    """
+    Return the part of the padded flat array that covers grid
+
+    @type grid: Grid
+    @type flat: numpy.ndarray
+    @rtype: numpy.ndarray
+    """
+    return flat.reshape(grid.height + 2, grid.width + 2)[1:-1, 1:-1].copy()
+
+
+def _allowed(masks, frontier):
+    """
+    Return a flat boolean array that is True for each step from each
+    cell in frontier, in the order of STEPS, that the padded neighbour
+    masks allow
+
+    @type masks: numpy.ndarray
+    @type frontier: numpy.ndarray
+    @rtype: numpy.ndarray
+    """
+    return (masks[frontier][:, None] >> BITS & 1).astype(bool).ravel()
+
+
+def reachable(grid, source=None):
+    """
+    Return a boolean array that is True at every cell the boat can
+    reach from source, which defaults to the boat of grid
+
+    @type grid: Grid
+    @type source: Node | None
+    @rtype: numpy.ndarray
+
+    >>> from grid import Grid
+    >>> g = Grid("", ["B.+.", "+++.", "..+T"])
+    >>> reachable(g).astype(int)
+    array([[1, 1, 0, 0],
+           [0, 0, 0, 0],
+           [0, 0, 0, 0]])
+    >>> g = Grid("", ["B+..", "+.+.", "...T"])
+    >>> g.set_corner_cutting(False)
+    >>> reachable(g).astype(int)
+    array([[1, 0, 0, 0],
+           [0, 0, 0, 0],
+           [0, 0, 0, 0]])
+    """
+    if source is None:
+        source = grid.boat
+    plane, offsets, costs = _padded(grid)
+    masks = _padded(grid, grid.neighbour_masks(), np.uint8)[0]
+    frontier = np.array([(source.grid_y + 1) * (grid.width + 2)
+                         + source.grid_x + 1])
+    unseen = plane.copy()
+    unseen[frontier] = False
+    seen = np.zeros_like(plane)
+    seen[frontier] = True
+    while frontier.size:
+        step = (frontier[:, None] + offsets).ravel()[_allowed(masks, frontier)]
+        step = step[unseen[step]]
+        unseen[step] = False
+        seen[step] = True
+        frontier = np.unique(step)
+    return _unpad(grid, seen)
+
+
+def distance_field(grid, source=None):
+    """
+    Return an integer array holding the length of the shortest path
+    from source, which defaults to the boat of grid, to every cell,
+    or -1 where the cell cannot be reached
+
+    Each round relaxes the neighbours of every cell whose distance went
+    down in the previous round, so on open water each cell is settled
+    by the first wave that reaches it.
+
+    @type grid: Grid
+    @type source: Node | None
+    @rtype: numpy.ndarray
+
+    >>> from grid import Grid
+    >>> g = Grid("", ["B.++", ".+..", "...T"])
+    >>> distance_field(g)
+    array([[ 0, 10, -1, -1],
+           [10, -1, 24, 34],
+           [20, 24, 34, 38]])
+    """
+    if source is None:
+        source = grid.boat
+    plane, offsets, costs = _padded(grid)
+    masks = _padded(grid, grid.neighbour_masks(), np.uint8)[0]
+    weights = _padded(grid, grid.costs, np.int64)[0]
+    dist = np.full(plane.shape, UNREACHED, dtype=np.int64)
+    frontier = np.array([(source.grid_y + 1) * (grid.width + 2)
+                         + source.grid_x + 1])
+    dist[frontier] = 0
+    while frontier.size:
+        step = (frontier[:, None] + offsets).ravel()
+        fee = (dist[frontier][:, None] + costs // 2 *
+               (weights[frontier][:, None] + weights[step].reshape(
+                   -1, len(offsets)))).ravel()
+        keep = _allowed(masks, frontier) & (fee < dist[step])
+        step = step[keep]
+        fee = fee[keep]
+        before = dist[step]
+        np.minimum.at(dist, step, fee)
+        frontier = np.unique(step[dist[step] < before])
+    dist[dist == UNREACHED] = -1
+    return _unpad(grid, dist)